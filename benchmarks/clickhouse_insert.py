@@ -0,0 +1,114 @@
+"""
+Throughput of ClickhouseLoader inserting 1000 chunks into the staging table.
+Needs a ClickHouse server, the connection is set by the environment variables,
+INSERT_PARALLELISM sets load.insert_parallelism.
+
+    CLICKHOUSE_HOST=localhost FLOWMASTER_HOME=/tmp/flowmaster-benchmark \
+        python benchmarks/clickhouse_insert.py
+"""
+import datetime as dt
+import os
+import time
+
+import clickhousepy
+
+from flowmaster.operators.etl.dataschema import ColumnarBatch, TransformContext
+from flowmaster.operators.etl.loaders import Loaders
+from flowmaster.operators.etl.policy import ETLNotebook
+from flowmaster.operators.etl.providers import Providers
+from flowmaster.utils.logging_helper import logger
+
+CHUNKS = 1000
+CHUNK_SIZE = 1000
+COLUMNS = ["Date", "Value"]
+
+
+def create_notebook() -> ETLNotebook:
+    return ETLNotebook(
+        name="__benchmark_clickhouse_insert__",
+        provider=Providers.FakeDataProvider.name,
+        storage=Loaders.ClickhouseLoader.name,
+        work=ETLNotebook.WorkPolicy(
+            triggers=ETLNotebook.WorkPolicy.TriggersPolicy(
+                schedule=ETLNotebook.WorkPolicy.TriggersPolicy.SchedulePolicy(
+                    timezone="UTC",
+                    start_time="00:00:00",
+                    from_date=dt.date(2021, 1, 1),
+                    interval="daily",
+                )
+            )
+        ),
+        export=Providers.FakeDataProvider.policy_model(rows=CHUNK_SIZE),
+        transform=Loaders.ClickhouseLoader.transform_policy_model(
+            error_policy="default", column_map={}
+        ),
+        load=Loaders.ClickhouseLoader.policy_model(
+            credentials=Loaders.ClickhouseLoader.policy_model.CredentialsPolicy(
+                host=os.environ.get("CLICKHOUSE_HOST", "localhost"),
+                port=int(os.environ.get("CLICKHOUSE_PORT", 9000)),
+                user=os.environ.get("CLICKHOUSE_USER", "default"),
+                password=os.environ.get("CLICKHOUSE_PASSWORD"),
+            ),
+            table_schema=Loaders.ClickhouseLoader.policy_model.TableSchemaPolicy(
+                db=os.environ.get("CLICKHOUSE_DB", "default"),
+                table="flowmaster_benchmark_insert",
+                columns=["Date Date", "Value UInt64"],
+                orders=["Date"],
+                partition=["Date"],
+            ),
+            data_cleaning_mode=Loaders.ClickhouseLoader.DataCleaningMode.off,
+            insert_parallelism=int(os.environ.get("INSERT_PARALLELISM", 1)),
+        ),
+    )
+
+
+def create_context() -> TransformContext:
+    date = dt.date(2021, 1, 1)
+    return TransformContext(
+        size=0,
+        insert_columns=COLUMNS,
+        partitions=[[date]],
+        data=ColumnarBatch(COLUMNS, [[date] * CHUNK_SIZE, list(range(CHUNK_SIZE))]),
+        data_errors=[],
+    )
+
+
+def main():
+    logger.remove()
+    # The driver converts the columns in place, each insert gets its own chunk.
+    contexts = [create_context() for _ in range(CHUNKS)]
+    loader = Loaders.ClickhouseLoader(create_notebook())
+
+    queries = 0
+    execute = clickhousepy.Client.execute
+
+    def counting_execute(*args, **kwargs):
+        nonlocal queries
+        queries += 1
+        return execute(*args, **kwargs)
+
+    try:
+        with loader:
+            clickhousepy.Client.execute = counting_execute
+            begin = time.perf_counter()
+            for context in contexts:
+                loader(context)
+            error = loader.wait_inserts()
+            duration = time.perf_counter() - begin
+            clickhousepy.Client.execute = execute
+            if error is not None:
+                raise error
+    finally:
+        loader.Table.drop_table()
+
+    print(
+        f"{CHUNKS} chunks of {CHUNK_SIZE} rows, "
+        f"insert_parallelism={loader.insert_parallelism}: "
+        f"{CHUNKS / duration:.0f} chunks/s, "
+        f"{CHUNKS * CHUNK_SIZE / duration:.0f} rows/s, "
+        f"{queries / CHUNKS:.1f} queries per chunk"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Memory and CPU of the transform and load steps per million rows:
+the chunks exported by rows and the chunks exported as a ColumnarBatch.
+
+    FLOWMASTER_HOME=/tmp/flowmaster-benchmark python benchmarks/columnar.py
+"""
+import datetime as dt
+import tempfile
+import time
+import tracemalloc
+
+from flowmaster.operators.etl.core import ETLOperator
+from flowmaster.operators.etl.dataschema import ColumnarBatch, ExportContext
+from flowmaster.operators.etl.enums import DataOrient
+from flowmaster.operators.etl.loaders import Loaders
+from flowmaster.operators.etl.policy import ETLNotebook
+from flowmaster.operators.etl.providers import Providers
+from flowmaster.utils.logging_helper import logger
+
+ROWS = 1_000_000
+CHUNK_SIZE = 100_000
+COLUMNS = ["id", "name", "date"]
+
+
+def create_notebook(path: str) -> ETLNotebook:
+    return ETLNotebook(
+        name="__benchmark_columnar__",
+        provider=Providers.FakeDataProvider.name,
+        storage=Loaders.CSVLoader.name,
+        work=ETLNotebook.WorkPolicy(
+            triggers=ETLNotebook.WorkPolicy.TriggersPolicy(
+                schedule=ETLNotebook.WorkPolicy.TriggersPolicy.SchedulePolicy(
+                    timezone="UTC",
+                    start_time="00:00:00",
+                    from_date=dt.date(2021, 1, 1),
+                    interval="daily",
+                )
+            )
+        ),
+        export=Providers.FakeDataProvider.policy_model(rows=ROWS),
+        transform=Loaders.CSVLoader.transform_policy_model(error_policy="default"),
+        load=Loaders.CSVLoader.policy_model(path=path, save_mode="w"),
+    )
+
+
+def iter_chunks(orient: str):
+    date = dt.date(2021, 1, 1).isoformat()
+    for start in range(0, ROWS, CHUNK_SIZE):
+        ids = range(start, start + CHUNK_SIZE)
+        if orient == DataOrient.values:
+            data = [[i, f"name{i}", date] for i in ids]
+        else:
+            data = ColumnarBatch(
+                COLUMNS, [list(ids), [f"name{i}" for i in ids], [date] * CHUNK_SIZE]
+            )
+        yield ExportContext(columns=COLUMNS, data=data, data_orient=orient)
+
+
+def measure(flow: ETLOperator, orient: str) -> tuple[float, float]:
+    tracemalloc.start()
+    begin = time.process_time()
+    with flow.Load:
+        for export_context in iter_chunks(orient):
+            flow.Load(flow.transform(export_context))
+    duration = time.process_time() - begin
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return duration, peak
+
+
+def main():
+    with tempfile.TemporaryDirectory() as path:
+        flow = ETLOperator(create_notebook(path))
+        logger.remove()
+        for orient in (DataOrient.values, DataOrient.columns):
+            duration, peak = measure(flow, orient)
+            scale = 1_000_000 / ROWS
+            print(
+                f"{orient:>7}: {duration * scale:.2f} s CPU and "
+                f"{peak * scale / 2 ** 20:.0f} MiB peak per million rows "
+                f"(chunks of {CHUNK_SIZE} rows)"
+            )
+
+
+if __name__ == "__main__":
+    main()
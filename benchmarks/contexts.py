@@ -0,0 +1,46 @@
+"""
+Cost of creating ExportContext and TransformContext for one chunk.
+
+    FLOWMASTER_HOME=/tmp/flowmaster-benchmark python benchmarks/contexts.py
+"""
+import timeit
+
+from flowmaster.operators.etl.dataschema import ExportContext, TransformContext
+from flowmaster.operators.etl.enums import DataOrient
+from flowmaster.utils.logging_helper import logger
+
+CHUNK_SIZE = 100_000
+NUMBER = 2000
+
+
+def main():
+    logger.remove()
+    columns = ["id", "name"]
+    data = [[i, f"name{i}"] for i in range(CHUNK_SIZE)]
+    data_errors = [[[0], row] for row in data[:1000]]
+
+    export_duration = timeit.timeit(
+        lambda: ExportContext(
+            columns=columns, data=data, data_orient=DataOrient.values
+        ),
+        number=NUMBER,
+    )
+    transform_duration = timeit.timeit(
+        lambda: TransformContext(
+            size=len(data),
+            insert_columns=columns,
+            partitions=[],
+            data=data,
+            data_errors=data_errors,
+        ),
+        number=NUMBER,
+    )
+    print(
+        f"chunk of {CHUNK_SIZE} rows: "
+        f"ExportContext {export_duration / NUMBER * 10 ** 6:.1f} us, "
+        f"TransformContext {transform_duration / NUMBER * 10 ** 6:.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Cost of scheduling one flow: FlowItem.get_items_for_execute on the flows with the history.
+
+    FLOWMASTER_HOME=/tmp/flowmaster-benchmark python benchmarks/scheduling.py
+"""
+import datetime as dt
+import time
+
+import pendulum
+
+from flowmaster.database import db
+from flowmaster.models import FlowItem
+from flowmaster.utils.logging_helper import logger
+
+FLOWS = 20
+HISTORY_ITEMS = 24 * 90
+TICKS = 5
+INTERVAL = dt.timedelta(hours=1)
+
+
+def main():
+    logger.remove()
+    now = pendulum.datetime(2021, 6, 1, tz="Europe/Moscow")
+    pendulum.set_test_now(now)
+    start_time = now - INTERVAL * HISTORY_ITEMS
+    names = [f"__benchmark_scheduling_{i}__" for i in range(FLOWS)]
+    for name in names:
+        FlowItem.clear(name)
+        FlowItem.create_missing_items(name, start_time, now - INTERVAL, INTERVAL)
+        FlowItem.change_status(name, "SUCCESS")
+
+    queries = 0
+    execute_sql = db.execute_sql
+
+    def counting_execute_sql(*args, **kwargs):
+        nonlocal queries
+        queries += 1
+        return execute_sql(*args, **kwargs)
+
+    db.execute_sql = counting_execute_sql
+    begin = time.perf_counter()
+    for tick in range(TICKS):
+        for name in names:
+            list(
+                FlowItem.get_items_for_execute(
+                    name,
+                    worktime=now + INTERVAL * tick,
+                    start_time=start_time,
+                    interval_timedelta=INTERVAL,
+                    keep_sequence=True,
+                    retries=1,
+                    retry_delay=60,
+                    notebook_hash="",
+                    max_fatal_errors=3,
+                )
+            )
+    duration = time.perf_counter() - begin
+    db.execute_sql = execute_sql
+
+    calls = TICKS * FLOWS
+    print(
+        f"{FLOWS} flows x {HISTORY_ITEMS} items, {TICKS} ticks: "
+        f"{duration / calls * 1000:.1f} ms and {queries / calls:.1f} queries per flow"
+    )
+
+    for name in names:
+        FlowItem.clear(name)
+
+
+if __name__ == "__main__":
+    main()
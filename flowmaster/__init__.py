@@ -11,6 +11,7 @@ def create_initial_dirs_and_files() -> None:
     pathlib.Path.mkdir(Settings.APP_HOME, exist_ok=True)
     pathlib.Path.mkdir(Settings.FILE_STORAGE_DIR, exist_ok=True)
     pathlib.Path.mkdir(Settings.LOGS_DIR, exist_ok=True)
+    pathlib.Path.mkdir(Settings.ITEMS_ARCHIVE_DIR, exist_ok=True)
     pathlib.Path.mkdir(Settings.NOTEBOOKS_DIR, exist_ok=True)
     pathlib.Path.mkdir(Settings.ARCHIVE_NOTEBOOKS_DIR, exist_ok=True)
     pathlib.Path.mkdir(Settings.PLUGINS_DIR, exist_ok=True)
@@ -8,6 +8,7 @@ import flowmaster.cli.db
 import flowmaster.cli.item
 import flowmaster.cli.notebook
 from flowmaster import create_initial_dirs_and_files
+from flowmaster.enums import ExecutorModes
 from flowmaster.setttings import Settings
 from flowmaster.web.views import webapp
 
@@ -64,23 +65,75 @@ def run(
     interval: int = 20,
     dry_run: bool = False,
     port: int = Settings.WEBUI_PORT,
+    executor: str = typer.Option(
+        ExecutorModes.thread,
+        help="thread - all steps in threads, "
+        "process - transform step in a pool of processes, "
+        "asyncio - tasks are driven from the event loop",
+    ),
+    broker: str = typer.Option(
+        Settings.BROKER_URL,
+        help="Shared state of several 'flowmaster run' processes, "
+        "for example sqlite:////mnt/shared/broker.sqlite",
+    ),
 ):
+    if executor not in (
+        ExecutorModes.thread,
+        ExecutorModes.process,
+        ExecutorModes.asyncio,
+    ):
+        raise typer.BadParameter(f"Unknown executor '{executor}'")
+
     typer.echo(f"\nAPP_HOME={Settings.APP_HOME}")
 
+    from flowmaster.broker import get_broker
+    from flowmaster.pool import pools
+
+    broker = get_broker(broker)
+    pools.set_broker(broker)
+
     create_initial_dirs_and_files()
     prepare_items(dry_run=dry_run)
     run_web(port)
 
     from flowmaster.operators.base.work import ordering_flow_tasks
-    from flowmaster.executors import ThreadAsyncExecutor
+    from flowmaster.executors import ThreadAsyncExecutor, AsyncioExecutor
 
-    typer.echo("Executor: ThreadAsyncExecutor")
+    if executor == ExecutorModes.asyncio:
+        executor_class = AsyncioExecutor
+    else:
+        executor_class = ThreadAsyncExecutor
+
+    typer.echo(f"Executor: {executor_class.__name__}")
     typer.echo(f"Number of workers: {workers}")
     typer.echo(f"Scheduler interval: {interval}")
-
-    order_task_func = partial(ordering_flow_tasks, dry_run=dry_run)
-    executor = ThreadAsyncExecutor(ordering_task_func=order_task_func)
+    if broker is not None:
+        typer.echo(f"Broker: {broker.__class__.__name__}, node {broker.node_id}")
+
+    transform_executor = None
+    if executor == ExecutorModes.process:
+        from flowmaster.operators.etl.transform.service import (
+            create_transform_executor,
+        )
+
+        transform_executor = create_transform_executor()
+        typer.echo("Transform step: ProcessPoolExecutor")
+
+    order_task_func = partial(
+        ordering_flow_tasks,
+        dry_run=dry_run,
+        transform_executor=transform_executor,
+        broker=broker,
+        batch_size=workers,
+    )
+    executor = executor_class(ordering_task_func=order_task_func)
     executor.start(interval=interval, workers=workers)
+    try:
+        executor.join()
+    finally:
+        executor.stop()
+        if transform_executor is not None:
+            transform_executor.shutdown(cancel_futures=True)
 
 
 if __name__ == "__main__":
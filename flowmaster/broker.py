@@ -0,0 +1,248 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import orjson
+
+from flowmaster.utils import get_node_id
+from flowmaster.utils.logging_helper import logger
+
+
+class BaseBroker:
+    """
+    State shared by several executor processes:
+    the queue of ordered tasks, the occupied pool slots and the leases.
+    """
+
+    # How often the changes made by other nodes need to be checked.
+    poll_interval: float = 1.0
+    # After this time without a heartbeat the node is considered dead
+    # and the pool slots it occupied are not taken into account.
+    node_ttl: float = 60.0
+    # Lifetime of the lease, if it is not renewed.
+    lease_ttl: float = 60.0
+
+    def __init__(self, node_id: Optional[str] = None):
+        self.node_id = node_id or get_node_id()
+
+    def heartbeat(self) -> None:
+        raise NotImplementedError()
+
+    def push(self, queue: str, messages: list[dict]) -> None:
+        raise NotImplementedError()
+
+    def pop(self, queue: str, limit: Optional[int] = None) -> list[dict]:
+        """Takes messages out of the queue, each message is received by only one node."""
+        raise NotImplementedError()
+
+    def qsize(self, queue: str) -> int:
+        raise NotImplementedError()
+
+    def acquire_slots(self, limits: dict[str, int]) -> bool:
+        """Takes a slot in all pools at once, if there is a free slot in each."""
+        raise NotImplementedError()
+
+    def change_slots(self, tags: list[str], switch: int) -> None:
+        raise NotImplementedError()
+
+    def slots(self, tag: str) -> int:
+        return self.slots_of([tag])[tag]
+
+    def slots_of(self, tags: list[str]) -> dict[str, int]:
+        """Occupied slots of several pools at once."""
+        raise NotImplementedError()
+
+    def lease(self, key: str, ttl: Optional[float] = None) -> bool:
+        """
+        Takes or renews the lease on the key.
+        Returns False if the key is leased by another node and its lease has not expired.
+        """
+        raise NotImplementedError()
+
+    def release_lease(self, key: str) -> None:
+        raise NotImplementedError()
+
+
+class SqliteBroker(BaseBroker):
+    """
+    Broker in the SQLite file.
+    Suitable for several processes on one machine or on a shared disk.
+    """
+
+    def __init__(self, path: Union[str, Path], node_id: Optional[str] = None):
+        super(SqliteBroker, self).__init__(node_id)
+        self.path = str(path)
+        self.create_tables()
+
+    @contextmanager
+    def transaction(self, *, read_only: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        The writes take the lock of the file at the beginning of the transaction.
+        The reads take it only for the time of the query and do not wait for each other.
+        """
+        # A connection for each call, so that the broker can be used from any thread.
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            connection.execute("BEGIN DEFERRED" if read_only else "BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            else:
+                connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def create_tables(self) -> None:
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS broker_queue ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT, message TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS broker_nodes ("
+                "node TEXT PRIMARY KEY, heartbeat REAL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS broker_slots ("
+                "tag TEXT, node TEXT, size INTEGER, PRIMARY KEY (tag, node))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS broker_leases ("
+                "key TEXT PRIMARY KEY, owner TEXT, expires REAL)"
+            )
+
+    def _heartbeat(self, connection: sqlite3.Connection) -> None:
+        connection.execute(
+            "INSERT INTO broker_nodes (node, heartbeat) VALUES (?, ?) "
+            "ON CONFLICT (node) DO UPDATE SET heartbeat = excluded.heartbeat",
+            (self.node_id, time.time()),
+        )
+
+    def heartbeat(self) -> None:
+        with self.transaction() as connection:
+            self._heartbeat(connection)
+
+    def push(self, queue: str, messages: list[dict]) -> None:
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO broker_queue (queue, message) VALUES (?, ?)",
+                [(queue, orjson.dumps(message)) for message in messages],
+            )
+
+    def pop(self, queue: str, limit: Optional[int] = None) -> list[dict]:
+        with self.transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, message FROM broker_queue "
+                "WHERE queue = ? ORDER BY id LIMIT ?",
+                (queue, -1 if limit is None else limit),
+            ).fetchall()
+            connection.executemany(
+                "DELETE FROM broker_queue WHERE id = ?", [(id_,) for id_, _ in rows]
+            )
+
+        return [orjson.loads(message) for _, message in rows]
+
+    def qsize(self, queue: str) -> int:
+        with self.transaction(read_only=True) as connection:
+            (count,) = connection.execute(
+                "SELECT COUNT(*) FROM broker_queue WHERE queue = ?", (queue,)
+            ).fetchone()
+
+        return count
+
+    def _slots(self, connection: sqlite3.Connection, tags: list[str]) -> dict[str, int]:
+        sizes = dict.fromkeys(tags, 0)
+        rows = connection.execute(
+            "SELECT s.tag, SUM(s.size) FROM broker_slots s "
+            "JOIN broker_nodes n ON n.node = s.node "
+            f"WHERE s.tag IN ({', '.join('?' * len(tags))}) "
+            "AND (n.node = ? OR n.heartbeat >= ?) "
+            "GROUP BY s.tag",
+            (*tags, self.node_id, time.time() - self.node_ttl),
+        )
+        sizes.update(rows)
+
+        return sizes
+
+    def _change_slots(
+        self, connection: sqlite3.Connection, tags: list[str], switch: int
+    ) -> None:
+        if switch > 0:
+            connection.executemany(
+                "INSERT INTO broker_slots (tag, node, size) VALUES (?, ?, ?) "
+                "ON CONFLICT (tag, node) DO UPDATE SET size = size + excluded.size",
+                [(tag, self.node_id, switch) for tag in tags],
+            )
+        else:
+            connection.executemany(
+                "UPDATE broker_slots SET size = MAX(size + ?, 0) "
+                "WHERE tag = ? AND node = ?",
+                [(switch, tag, self.node_id) for tag in tags],
+            )
+
+    def acquire_slots(self, limits: dict[str, int]) -> bool:
+        with self.transaction() as connection:
+            self._heartbeat(connection)
+            sizes = self._slots(connection, list(limits))
+            for tag, limit in limits.items():
+                if sizes[tag] >= limit:
+                    logger.debug("Shared pool '{}' full", tag)
+                    return False
+
+            self._change_slots(connection, list(limits), 1)
+
+        return True
+
+    def change_slots(self, tags: list[str], switch: int) -> None:
+        with self.transaction() as connection:
+            self._heartbeat(connection)
+            self._change_slots(connection, tags, switch)
+
+    def slots_of(self, tags: list[str]) -> dict[str, int]:
+        if not tags:
+            return {}
+
+        with self.transaction(read_only=True) as connection:
+            return self._slots(connection, tags)
+
+    def lease(self, key: str, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        expires = now + (self.lease_ttl if ttl is None else ttl)
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO broker_leases (key, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE "
+                "SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE broker_leases.owner = excluded.owner "
+                "OR broker_leases.expires < ?",
+                (key, self.node_id, expires, now),
+            )
+
+            return cursor.rowcount == 1
+
+    def release_lease(self, key: str) -> None:
+        with self.transaction() as connection:
+            connection.execute(
+                "DELETE FROM broker_leases WHERE key = ? AND owner = ?",
+                (key, self.node_id),
+            )
+
+
+def get_broker(url: Optional[str]) -> Optional[BaseBroker]:
+    """
+    Creates a broker by url, for example, sqlite:////mnt/shared/broker.sqlite
+    Without url, the executor works only with its own in-process state.
+    """
+    if not url:
+        return None
+
+    scheme, _, path = url.partition("://")
+    if scheme == "sqlite":
+        # As in SQLAlchemy: sqlite:///relative/path, sqlite:////absolute/path
+        return SqliteBroker(path[1:] if path.startswith("/") else path)
+
+    raise ValueError(f"Unsupported broker: {url}")
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import typer
 
 app = typer.Typer()
@@ -5,7 +7,31 @@ app = typer.Typer()
 
 @app.command()
 def reset():
-    from flowmaster.models import FlowItem
+    from flowmaster.models import (
+        FlowItem,
+        FlowItemArchive,
+        FlowStatusCounter,
+        create_tables,
+    )
+
+    for model in (FlowItem, FlowItemArchive, FlowStatusCounter):
+        model.drop_table()
+
+    create_tables()
+
+
+@app.command()
+def compact(
+    days: Optional[int] = typer.Option(
+        None, help="Retention period for notebooks without work.retention_days"
+    ),
+    vacuum: bool = True,
+):
+    from flowmaster.models import vacuum as vacuum_database
+    from flowmaster.service import compact_items
+
+    for name, count in compact_items(days).items():
+        typer.secho(f"  {name} {typer.style(f'{count=}', fg=typer.colors.WHITE)} OK")
 
-    FlowItem.drop_table()
-    FlowItem.create_table()
+    if vacuum:
+        vacuum_database()
@@ -2,6 +2,7 @@ import datetime as dt
 
 import typer
 
+from flowmaster.database import read_db
 from flowmaster.enums import Statuses
 from flowmaster.models import FlowItem
 
@@ -10,7 +11,7 @@ app = typer.Typer()
 
 @app.command("list")
 def list_items(name: str, limit: int = 20):
-    for i in FlowItem.iter_items(name, limit=limit):
+    for i in FlowItem.iter_items(name, limit=limit).bind(read_db):
         msg_parts = [
             f'  {i.worktime.strftime("%Y-%m-%dT%T").replace("T00:00:00", "")}  ',
             f"{i.status}  ",
@@ -33,7 +34,7 @@ def list_items(name: str, limit: int = 20):
 
 @app.command()
 def list_errors(name: str, limit: int = 1000):
-    for i in FlowItem.iter_items(name, limit=limit):
+    for i in FlowItem.iter_items(name, limit=limit).bind(read_db):
         if i.status in Statuses.error_statuses:
             msg_parts = [
                 f'  {i.worktime.strftime("%Y-%m-%dT%T").replace("T00:00:00", "")}  ',
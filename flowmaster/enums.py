@@ -14,3 +14,10 @@ class Statuses:
 class Operators:
     etl = "ETL"
     LiteralT = Literal[etl]
+
+
+class ExecutorModes:
+    thread = "thread"
+    process = "process"
+    asyncio = "asyncio"
+    LiteralT = Literal[thread, process, asyncio]
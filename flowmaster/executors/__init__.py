@@ -1,9 +1,15 @@
+import asyncio
 import datetime as dt
 import functools
-import queue
+import heapq
+import itertools
+import math
 import threading
 import time
-from typing import Optional, TypeVar, Union, Callable
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set, TypeVar, Union, Callable
 
 import pendulum
 
@@ -16,9 +22,6 @@ from flowmaster.executors.exceptions import (
 from flowmaster.pool import pools
 from flowmaster.utils.logging_helper import logger
 
-task_queue = queue.Queue()
-sleeptask_queue = queue.Queue()
-threading_event = threading.Event()
 threading_lock = threading.RLock()
 
 
@@ -36,27 +39,85 @@ def catch_exceptions(func):
 class SleepIteration:
     def __init__(self, sleep):
         self.sleep = sleep
-        self._time_begin = pendulum.now()
+        self.wake_up_time = time.monotonic() + sleep
 
     def reset(self):
-        self._time_begin = pendulum.now()
+        self.wake_up_time = time.monotonic() + self.sleep
 
     def allow(self) -> bool:
-        return pendulum.now() > self._time_begin.add(seconds=self.sleep)
+        return time.monotonic() >= self.wake_up_time
 
     def rest_of_sleep(self) -> int:
-        a = (self._time_begin.add(seconds=self.sleep) - pendulum.now()).seconds
-        return max(0, a)
+        return max(0, math.ceil(self.wake_up_time - time.monotonic()))
 
 
 class NextIterationInPools:
     def __init__(self, pool_names: Optional[list[str]], sleep=1):
         self.pool_names = pool_names
         self.sleep = sleep
-        self._time_begin = pendulum.now()
+        self.wake_up_time = time.monotonic() + sleep
+        self._wake_lock = threading.Lock()
+        self._wake_callback: Optional[Callable[[], None]] = None
+        self._is_woken = False
+
+    def reset(self):
+        self.wake_up_time = time.monotonic() + self.sleep
+        with self._wake_lock:
+            self._wake_callback = None
+            self._is_woken = False
 
     def allow(self) -> bool:
-        return pools.allow(self.pool_names)
+        return pools.allow(self.pool_names, self)
+
+    def acquire(self) -> bool:
+        """Takes a slot in the pools or gets on the wait list."""
+        # The wake state is reset before getting on the wait list,
+        # otherwise a slot released right after would not wake the waiter.
+        self.reset()
+        return pools.acquire(self.pool_names, self)
+
+    def cancel(self) -> None:
+        """Leaves the wait lists of the pools."""
+        pools.remove_waiter(self)
+
+    def wait(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """
+        Blocks the thread until a slot is taken in the pools.
+        Returns False if the stop event is set while waiting.
+        """
+        while not self.acquire():
+            released = threading.Event()
+            self.on_wake(released.set)
+            # With a broker, the release of slots by other nodes is not notified.
+            released.wait(self.sleep)
+            if stop_event is not None and stop_event.is_set():
+                self.cancel()
+                return False
+
+        return True
+
+    def wake(self) -> None:
+        """Called by the pool when a slot is released for this waiter."""
+        with self._wake_lock:
+            callback, self._wake_callback = self._wake_callback, None
+            if callback is None:
+                self._is_woken = True
+
+        if callback is not None:
+            callback()
+
+    def on_wake(self, callback: Callable[[], None]) -> None:
+        """
+        Sets the function that will be called when the slot is released.
+        If the slot was released before, the function is called immediately.
+        """
+        with self._wake_lock:
+            is_woken, self._is_woken = self._is_woken, False
+            if not is_woken:
+                self._wake_callback = callback
+
+        if is_woken:
+            callback()
 
     def done(self) -> None:
         pools[self.pool_names] = -1
@@ -65,8 +126,7 @@ class NextIterationInPools:
         pools[self.pool_names] = 1
 
     def rest_of_sleep(self) -> int:
-        a = (self._time_begin.add(seconds=self.sleep) - pendulum.now()).seconds
-        return max(0, a)
+        return max(0, math.ceil(self.wake_up_time - time.monotonic()))
 
 
 AsyncIterationT = TypeVar(
@@ -102,6 +162,12 @@ class ExecutorIterationTask:
             return self._sleep_item.allow()
         return True
 
+    def wake_up_time(self) -> float:
+        """Monotonic time after which the task can be executed again."""
+        if self._sleep_item is not None:
+            return self._sleep_item.wake_up_time
+        return time.monotonic()
+
     def check_limit(self) -> None:
         if self.expires is not None and pendulum.now("UTC") > self.expires:
             raise ExpiredError(
@@ -117,38 +183,51 @@ class ExecutorIterationTask:
                 f"{self.execute_duration=}, {self.duration=}, {self.expires=}"
             )
 
-    def _iterate(self):
-        if self._sleep_item is None:
-            result = next(self.iterator)
+    def on_pool_release(self, callback: Callable[[], None]) -> None:
+        """Calls the function when the pool the task is waiting for releases a slot."""
+        if isinstance(self._sleep_item, NextIterationInPools):
+            self._sleep_item.on_wake(callback)
         else:
-            result = self._sleep_item
-            self._sleep_item = None
+            callback()
+
+    def cancel(self) -> None:
+        """Leaves the pool wait lists, if the task is waiting for a slot."""
+        if isinstance(self._sleep_item, NextIterationInPools):
+            self._sleep_item.cancel()
+
+    def _iterate(self):
+        while True:
+            if self._sleep_item is None:
+                result = next(self.iterator)
+            else:
+                result = self._sleep_item
+                self._sleep_item = None
 
-        if isinstance(result, NextIterationInPools):
-            with threading_lock:
+            if isinstance(result, NextIterationInPools):
                 pool: NextIterationInPools = result
-                if not pool.allow():
+                if not pool.acquire():
                     self._sleep_item = pool
                     raise PoolOverflowingException(sleep=pool.sleep)
-                else:
-                    pool.put()
 
-            try:
-                self._sleep_item = None
-                return self._iterate()
-            finally:
-                pool.done()
+                try:
+                    # Only the next iteration is executed in the pool,
+                    # the slot is released before the next pool or sleep is processed.
+                    result = next(self.iterator)
+                finally:
+                    pool.done()
 
-        elif isinstance(result, SleepIteration):
-            sleep_iteration: SleepIteration = result
-            if not sleep_iteration.allow():
-                self._sleep_item = sleep_iteration
-                raise SleepException(sleep=sleep_iteration.rest_of_sleep())
-            else:
-                self._sleep_item = None
-                return self._iterate()
+                if isinstance(result, (NextIterationInPools, SleepIteration)):
+                    self._sleep_item = result
+                    continue
 
-        return result
+            elif isinstance(result, SleepIteration):
+                sleep_iteration: SleepIteration = result
+                if not sleep_iteration.allow():
+                    self._sleep_item = sleep_iteration
+                    raise SleepException(sleep=sleep_iteration.rest_of_sleep())
+                continue
+
+            return result
 
     def __iter__(self):
         return self
@@ -157,15 +236,22 @@ class ExecutorIterationTask:
         if self.iteration_num == 0:
             self.begin_time = time.time()
 
-        self.check_limit()
-        iteration_begin_time = time.time()
         try:
-            return self._iterate()
-        finally:
-            self.iteration_num += 1
-            self.execute_duration = time.time() - iteration_begin_time
-            self.duration = time.time() - self.begin_time
             self.check_limit()
+            iteration_begin_time = time.time()
+            try:
+                return self._iterate()
+            finally:
+                self.iteration_num += 1
+                self.execute_duration = time.time() - iteration_begin_time
+                self.duration = time.time() - self.begin_time
+                self.check_limit()
+        except SleepException:
+            raise
+        except BaseException:
+            # The task will not be continued, so it should not hold a place in the pool queue.
+            self.cancel()
+            raise
 
     def execute(self) -> list:
         """
@@ -177,33 +263,137 @@ class ExecutorIterationTask:
             while True:
                 try:
                     yield next(self)
-                except (SleepException, PoolOverflowingException) as sleep_iteration:
-                    time.sleep(sleep_iteration.sleep)
+                except PoolOverflowingException as sleep_iteration:
+                    pool_released = threading.Event()
+                    self.on_pool_release(pool_released.set)
+                    pool_released.wait(sleep_iteration.sleep)
+                except SleepException:
+                    time.sleep(max(0.0, self.wake_up_time() - time.monotonic()))
                 except StopIteration:
                     break
 
         return list(_())
 
 
+class ReadyQueue:
+    """
+    Queue of tasks ready for execution.
+    Resumed tasks (woken after sleep) are given out before new ones.
+    Workers block on the condition until a task appears, without polling.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.new_tasks: deque[ExecutorIterationTask] = deque()
+        self.resumed_tasks: deque[ExecutorIterationTask] = deque()
+
+    def put(self, task: ExecutorIterationTask, *, resumed: bool = False) -> None:
+        with self.condition:
+            if resumed:
+                self.resumed_tasks.append(task)
+            else:
+                self.new_tasks.append(task)
+            self.condition.notify()
+
+    def get(
+        self, stop_event: threading.Event, timeout: Optional[float] = None
+    ) -> Optional[ExecutorIterationTask]:
+        """Returns None if the stop event is set or the timeout has expired."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.resumed_tasks or self.new_tasks or stop_event.is_set(),
+                timeout,
+            )
+            if stop_event.is_set():
+                return None
+            if self.resumed_tasks:
+                return self.resumed_tasks.popleft()
+            if self.new_tasks:
+                return self.new_tasks.popleft()
+
+    def get_nowait(self) -> Optional[ExecutorIterationTask]:
+        return self.get(threading.Event(), timeout=0)
+
+    def wakeup(self) -> None:
+        """Wakes up all waiting workers, so that they check the stop event."""
+        with self.condition:
+            self.condition.notify_all()
+
+    def clear(self) -> None:
+        with self.condition:
+            self.new_tasks.clear()
+            self.resumed_tasks.clear()
+
+    def qsize(self) -> int:
+        return len(self.new_tasks) + len(self.resumed_tasks)
+
+    def new_qsize(self) -> int:
+        return len(self.new_tasks)
+
+    def resumed_qsize(self) -> int:
+        return len(self.resumed_tasks)
+
+
+# Executors started in this process, the flowmaster_data provider reads their queues.
+running_executors: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def poll_shared_state() -> None:
+    """Notifies the broker that the node is alive and checks the slots released by other nodes."""
+    if pools.broker is not None:
+        pools.broker.heartbeat()
+        pools.refresh()
+
+
 class ThreadAsyncExecutor:
     def __init__(self, ordering_task_func: Callable, *, dry_run: bool = False):
         self.order_task_func = ordering_task_func
         self.dry_run = dry_run
-        self.sleeping_task_storage: list[ExecutorIterationTask] = []
+        # Heap of sleeping tasks ordered by wake-up time.
+        self.sleeping_task_storage: list[tuple[float, int, ExecutorIterationTask]] = []
+        self.sleeping_condition = threading.Condition()
+        self._sleeping_counter = itertools.count()
+        self.stop_event = threading.Event()
+        self.ready_queue = ReadyQueue()
+        # Tasks waiting for a pool slot, they are returned to the queue on release.
+        self.parked_tasks: set[ExecutorIterationTask] = set()
+        self._parked_lock = threading.Lock()
         self.threads = {}
 
+    def add_sleeping_task(self, task: ExecutorIterationTask) -> None:
+        with self.sleeping_condition:
+            wake_up_time = task.wake_up_time()
+            is_earliest = (
+                not self.sleeping_task_storage
+                or wake_up_time < self.sleeping_task_storage[0][0]
+            )
+            heapq.heappush(
+                self.sleeping_task_storage,
+                (wake_up_time, next(self._sleeping_counter), task),
+            )
+            if is_earliest:
+                # The scheduler sleeps until the nearest deadline, wake it up to recalculate.
+                self.sleeping_condition.notify()
+
     def wake_sleep_func(self) -> None:
-        """Get the task out of sleep and add it to the queue."""
-        new_sleeping_storage = []
-        while self.sleeping_task_storage:
-            sleep_task = self.sleeping_task_storage.pop(0)
-            sleep_task: ExecutorIterationTask
-            if sleep_task.allow():
-                sleeptask_queue.put(sleep_task)
-            else:
-                new_sleeping_storage.append(sleep_task)
+        """Get the tasks whose wake-up time has come out of sleep and add them to the queue."""
+        with self.sleeping_condition:
+            now = time.monotonic()
+            while (
+                self.sleeping_task_storage and self.sleeping_task_storage[0][0] <= now
+            ):
+                _, _, sleep_task = heapq.heappop(self.sleeping_task_storage)
+                self.ready_queue.put(sleep_task, resumed=True)
+
+    def wait_wake_up(self, timeout: float) -> None:
+        """Sleeps until the nearest wake-up time, but no longer than timeout."""
+        with self.sleeping_condition:
+            if self.sleeping_task_storage:
+                until_wake_up = self.sleeping_task_storage[0][0] - time.monotonic()
+                timeout = min(timeout, until_wake_up)
 
-        self.sleeping_task_storage = new_sleeping_storage
+            if timeout > 0:
+                self.sleeping_condition.wait(timeout)
 
     def fill_queue(self) -> None:
         """Adds new function to the queue"""
@@ -211,45 +401,44 @@ class ThreadAsyncExecutor:
         with threading_lock:
             for task in self.order_task_func():
                 task: ExecutorIterationTask
-                task_queue.put(task)
+                self.ready_queue.put(task)
                 count += 1
 
         logger.info("Count ordering task: {}", count)
 
-    def get_task(self) -> tuple[queue.Queue, ExecutorIterationTask]:
-        while not threading_event.is_set():
-            try:
-                # Если убрать задержку, то спящие таски плохо поднимаются в очередь.
-                task: ExecutorIterationTask = sleeptask_queue.get(
-                    timeout=0 if self.dry_run else 1
-                )
-            except queue.Empty:
-                ...
-            else:
-                return sleeptask_queue, task
-
-            try:
-                task: ExecutorIterationTask = task_queue.get_nowait()
-            except queue.Empty:
-                ...
-            else:
-                return task_queue, task
+    def park_task(self, task: ExecutorIterationTask) -> None:
+        """The task will be returned to the queue by the pool when the slot is released."""
+        with self._parked_lock:
+            self.parked_tasks.add(task)
+        task.on_pool_release(functools.partial(self.resume_parked_task, task))
+
+    def resume_parked_task(self, task: ExecutorIterationTask) -> None:
+        with self._parked_lock:
+            self.parked_tasks.discard(task)
+        self.ready_queue.put(task, resumed=True)
+
+    def cancel_waiting_tasks(self) -> None:
+        """The tasks that will not be executed leave the pool wait lists."""
+        with self._parked_lock:
+            tasks = [*self.parked_tasks, *self.ready_queue.resumed_tasks]
+            self.parked_tasks.clear()
+        for task in tasks:
+            task.cancel()
 
     def worker(self) -> None:
         logger.info("Start worker")
         try:
-            while not threading_event.is_set():
-                queue_and_task = self.get_task()
-                if queue_and_task:
-                    queue_, task = queue_and_task
+            while not self.stop_event.is_set():
+                task = self.ready_queue.get(self.stop_event)
+                if task is not None:
                     try:
                         list(task)
-                    except (SleepException, PoolOverflowingException):
-                        self.sleeping_task_storage.append(task)
+                    except PoolOverflowingException:
+                        self.park_task(task)
+                    except SleepException:
+                        self.add_sleeping_task(task)
                     except Exception as exc:
                         logger.error("Fail task: {}", exc)
-                    finally:
-                        queue_.task_done()
         except:
             logger.exception("Fail worker")
         finally:
@@ -282,19 +471,21 @@ class ThreadAsyncExecutor:
             duration = order_interval
             num_order = 0
 
-            while not threading_event.is_set() and (
+            while not self.stop_event.is_set() and (
                 work_duration is None or time.time() - begin < work_duration
             ):
                 self.wake_sleep_func()
+                poll_shared_state()
 
-                if duration >= order_interval:
+                # In dry run, the orders follow one another without waiting for the interval.
+                if duration >= order_interval or self.dry_run:
                     duration = 0
                     iter_begin = time.time()
 
                     logger.info("Pool info: {}", pools.info_text())
                     logger.info(
                         "The number of new tasks in the queue: {}",
-                        task_queue.qsize() + sleeptask_queue.qsize(),
+                        self.ready_queue.qsize(),
                     )
                     logger.info(
                         "Number of sleeping tasks in the queue: {}",
@@ -307,8 +498,16 @@ class ThreadAsyncExecutor:
                     else:
                         break
 
-                time.sleep(0 if self.dry_run else 1)
-                duration += time.time() - iter_begin
+                timeout = order_interval - (time.time() - iter_begin)
+                if work_duration is not None:
+                    timeout = min(timeout, work_duration - (time.time() - begin))
+                if pools.broker is not None:
+                    timeout = min(timeout, pools.broker.poll_interval)
+                if self.dry_run:
+                    timeout = 0
+                self.wait_wake_up(timeout)
+
+                duration = time.time() - iter_begin
 
             logger.info("Stop scheduler")
 
@@ -326,9 +525,184 @@ class ThreadAsyncExecutor:
         orders: int = None,
         work_duration: int = None,
     ) -> None:
+        running_executors.add(self)
         self.create_worker_in_thread(workers)
         self.run_continuously(interval, orders, work_duration)
 
     def stop(self) -> None:
-        threading_event.set()
+        self.stop_event.set()
+        self.ready_queue.wakeup()
+        with self.sleeping_condition:
+            self.sleeping_condition.notify_all()
         [thread.join() for thread in self.threads.values()]
+        self.cancel_waiting_tasks()
+        self.ready_queue.clear()
+        running_executors.discard(self)
+
+    def join(self) -> None:
+        """Waits until the scheduler stops."""
+        self.threads["Flowmaster_scheduler"].join()
+
+    def queue_sizes(self) -> dict[str, int]:
+        return {
+            "tasks": self.ready_queue.new_qsize(),
+            "sleeptasks": self.ready_queue.resumed_qsize(),
+        }
+
+
+class AsyncioExecutor:
+    """
+    Tasks are driven from the event loop.
+    Iterations are executed in a pool of threads, and while the task is sleeping
+    or waiting for a pool slot, it does not occupy a thread.
+    """
+
+    def __init__(self, ordering_task_func: Callable, *, dry_run: bool = False):
+        self.order_task_func = ordering_task_func
+        self.dry_run = dry_run
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_pool: Optional[ThreadPoolExecutor] = None
+        self.stop_event: Optional[asyncio.Event] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    async def wait_pool_release(self, task: ExecutorIterationTask) -> None:
+        released = self.loop.create_future()
+
+        def set_released():
+            if not released.done():
+                released.set_result(None)
+
+        task.on_pool_release(
+            functools.partial(self.loop.call_soon_threadsafe, set_released)
+        )
+        await released
+
+    async def execute_task(self, task: ExecutorIterationTask) -> None:
+        while True:
+            try:
+                await self.loop.run_in_executor(self.thread_pool, list, task)
+            except PoolOverflowingException:
+                try:
+                    await self.wait_pool_release(task)
+                except asyncio.CancelledError:
+                    # The task will not be continued, so it leaves the pool wait lists.
+                    task.cancel()
+                    raise
+            except SleepException:
+                await asyncio.sleep(max(0.0, task.wake_up_time() - time.monotonic()))
+            except Exception as exc:
+                logger.error("Fail task: {}", exc)
+                break
+            else:
+                break
+
+    def add_task(self, task: ExecutorIterationTask) -> None:
+        asyncio_task = self.loop.create_task(self.execute_task(task))
+        self.tasks.add(asyncio_task)
+        asyncio_task.add_done_callback(self.tasks.discard)
+
+    async def fill_queue(self) -> None:
+        """Adds new function to the event loop"""
+        tasks = await self.loop.run_in_executor(
+            self.thread_pool, lambda: list(self.order_task_func())
+        )
+        for task in tasks:
+            self.add_task(task)
+
+        logger.info("Count ordering task: {}", len(tasks))
+
+    async def scheduler(
+        self, order_interval: Union[int, float], orders: int, work_duration: int
+    ) -> None:
+        logger.info("Start scheduler")
+        begin = time.time()
+        iter_begin = time.time()
+        duration = order_interval
+        num_order = 0
+
+        while not self.stop_event.is_set() and (
+            work_duration is None or time.time() - begin < work_duration
+        ):
+            if pools.broker is not None:
+                await self.loop.run_in_executor(self.thread_pool, poll_shared_state)
+
+            if duration >= order_interval:
+                duration = 0
+                iter_begin = time.time()
+
+                if orders is not None and num_order >= orders:
+                    break
+
+                logger.info("Pool info: {}", pools.info_text())
+                logger.info("Number of tasks in the event loop: {}", len(self.tasks))
+
+                await self.fill_queue()
+                num_order += 1
+
+            timeout = order_interval - (time.time() - iter_begin)
+            if work_duration is not None:
+                timeout = min(timeout, work_duration - (time.time() - begin))
+            if pools.broker is not None:
+                timeout = min(timeout, pools.broker.poll_interval)
+
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), max(0, timeout))
+            except asyncio.TimeoutError:
+                ...
+
+            duration = time.time() - iter_begin
+
+        logger.info("Stop scheduler")
+
+    async def main(
+        self,
+        workers: int,
+        order_interval: Union[int, float],
+        orders: int,
+        work_duration: int,
+    ) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.thread_pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="FlowMaster_worker"
+        )
+        self._started.set()
+        try:
+            await self.scheduler(order_interval, orders, work_duration)
+            await self.stop_event.wait()
+        finally:
+            for asyncio_task in list(self.tasks):
+                asyncio_task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.thread_pool.shutdown(wait=True)
+
+    def start(
+        self,
+        workers: int = 1,
+        interval: Union[int, float] = 15,
+        orders: int = None,
+        work_duration: int = None,
+    ) -> None:
+        self.thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.main(workers, interval, orders, work_duration),),
+            name="Flowmaster_event_loop",
+        )
+        self.thread.start()
+        self._started.wait()
+        running_executors.add(self)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.stop_event.set)
+        self.thread.join()
+        running_executors.discard(self)
+
+    def join(self) -> None:
+        """Waits until the event loop stops."""
+        self.thread.join()
+
+    def queue_sizes(self) -> dict[str, int]:
+        # Sleeping tasks and tasks waiting for a pool are not queued, they wait in the event loop.
+        return {"tasks": len(self.tasks), "sleeptasks": 0}
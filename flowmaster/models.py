@@ -1,6 +1,10 @@
+import calendar
 import datetime as dt
-from functools import partial
-from typing import Union, Iterable, Optional, Sequence
+import gzip
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import ContextManager, Union, Iterable, Iterator, Optional, Sequence
 
 import orjson
 import peewee
@@ -8,14 +12,25 @@ import pendulum
 import playhouse.sqlite_ext
 import pydantic
 from playhouse.hybrid import hybrid_property
+from playhouse.sqliteq import SqliteQueueDatabase
 
 from flowmaster.database import db
 from flowmaster.enums import Statuses
-from flowmaster.utils import iter_period_from_range, iter_range_datetime, custom_encoder
+from flowmaster.setttings import Settings
+from flowmaster.utils import (
+    chunker,
+    iter_period_from_range,
+    iter_range_datetime,
+    custom_encoder,
+    get_node_id,
+)
 from flowmaster.utils.logging_helper import logger
 
 
 class DateTimeTZField(playhouse.sqlite_ext.DateTimeField):
+    # The value with the timezone name is not a valid timestamp for PostgreSQL.
+    field_type = "TEXT"
+
     def python_value(self, value: str) -> dt.datetime:
         dt_str, tz_name = value.split(" ")
         return pendulum.parse(dt_str, tz=tz_name)
@@ -32,24 +47,57 @@ class DateTimeTZField(playhouse.sqlite_ext.DateTimeField):
             return f"{dt_str} {value.timezone_name}"
 
 
-class DateTimeUTCField(playhouse.sqlite_ext.DateTimeField):
-    def python_value(self, value: str) -> pendulum.DateTime:
-        if value is not None:
-            return pendulum.parse(value, tz=pendulum.timezone("UTC"))
+class TimestampField(playhouse.sqlite_ext.BigIntegerField):
+    """Epoch seconds of the datetime, so that time ranges are compared as numbers."""
 
     def db_value(
-        self, value: Optional[Union[dt.datetime, pendulum.DateTime]]
-    ) -> Optional[str]:
+        self, value: Optional[Union[dt.datetime, pendulum.DateTime, int]]
+    ) -> Optional[int]:
+        if isinstance(value, dt.datetime):
+            return pendulum.instance(value).int_timestamp
+
+        return value
+
+
+class DateTimeUTCField(playhouse.sqlite_ext.BigIntegerField):
+    """Stored as epoch microseconds."""
+
+    def python_value(self, value: Optional[Union[int, str]]) -> pendulum.DateTime:
+        if isinstance(value, str):
+            # ISO string of the older versions.
+            return pendulum.parse(value, tz=pendulum.timezone("UTC"))
+
         if value is not None:
+            seconds, microseconds = divmod(value, 1_000_000)
+            return pendulum.from_timestamp(seconds, tz="UTC").add(
+                microseconds=microseconds
+            )
+
+    def db_value(
+        self, value: Optional[Union[dt.datetime, pendulum.DateTime, int]]
+    ) -> Optional[int]:
+        if isinstance(value, dt.datetime):
             if value.tzinfo is None:
                 raise ValueError(f"{value} timezone not set.")
 
-            value = value.astimezone(pendulum.timezone("UTC"))
-            value = value.replace(tzinfo=None).isoformat()
+            seconds = calendar.timegm(value.utctimetuple())
+            value = seconds * 1_000_000 + value.microsecond
 
         return value
 
 
+class JSONField(playhouse.sqlite_ext.TextField):
+    """JSON as text, unlike the JSON1 field of SQLite it works in any database."""
+
+    def db_value(self, value) -> Optional[str]:
+        if value is not None:
+            return orjson.dumps(value, default=custom_encoder).decode()
+
+    def python_value(self, value: Optional[Union[str, bytes]]):
+        if value is not None:
+            return orjson.loads(value)
+
+
 class BaseDBModel(playhouse.sqlite_ext.Model):
     class Meta:
         database = db
@@ -58,15 +106,17 @@ class BaseDBModel(playhouse.sqlite_ext.Model):
 class FlowItem(BaseDBModel):
     """When changing fields, update to operators.etl.providers.flowmaster_data.policy.FlowmasterDataExportPolicy"""
 
+    # Rows in one insert, so as not to exceed the SQLite limit on the number of variables.
+    insert_batch_size = 50
+    update_batch_size = 500
+
     name = playhouse.sqlite_ext.CharField()
     worktime = DateTimeTZField()
+    # Filled in on insert, the time range queries use it instead of the text worktime.
+    worktime_ts = TimestampField(null=True)
 
     status = playhouse.sqlite_ext.CharField(default=Statuses.add, null=False)
-    data = playhouse.sqlite_ext.JSONField(
-        default={},
-        json_dumps=partial(orjson.dumps, default=custom_encoder),
-        json_loads=orjson.loads,
-    )
+    data = JSONField(default={})
     notebook_hash = playhouse.sqlite_ext.CharField(default="", null=False)
     retries = playhouse.sqlite_ext.IntegerField(default=0)
     duration = playhouse.sqlite_ext.IntegerField(null=True)
@@ -77,9 +127,39 @@ class FlowItem(BaseDBModel):
     finished_utc = DateTimeUTCField(null=True)
     created_utc = DateTimeUTCField(default=pendulum.now("UTC"))
     updated_utc = DateTimeUTCField(default=pendulum.now("UTC"))
+    # The executor process that claimed the item and until when.
+    lease_owner = playhouse.sqlite_ext.CharField(null=True)
+    lease_expires_utc = DateTimeUTCField(null=True)
 
     class Meta:
         primary_key = playhouse.sqlite_ext.CompositeKey("name", "worktime")
+        indexes = (
+            (("name", "status", "worktime_ts"), False),
+            (("name", "updated_utc"), False),
+        )
+
+    @classmethod
+    def _set_worktime_ts(cls, row: dict) -> dict:
+        for key in (cls.worktime, cls.worktime.name):
+            if row.get(key) is not None:
+                return {**row, cls.worktime_ts.name: row[key]}
+
+        return row
+
+    @classmethod
+    def insert(cls, __data=None, **insert) -> peewee.ModelInsert:
+        if isinstance(__data, dict) or __data is None:
+            __data = cls._set_worktime_ts({**(__data or {}), **insert})
+            insert = {}
+
+        return super(FlowItem, cls).insert(__data, **insert)
+
+    @classmethod
+    def insert_many(cls, rows, fields=None) -> peewee.ModelInsert:
+        rows = [
+            cls._set_worktime_ts(row) if isinstance(row, dict) else row for row in rows
+        ]
+        return super(FlowItem, cls).insert_many(rows, fields)
 
     @hybrid_property
     def worktime_for_url(self):
@@ -124,7 +204,7 @@ class FlowItem(BaseDBModel):
 
     @classmethod
     def first_item(cls, flow_name: str) -> Optional["FlowItem"]:
-        items = cls.select().where(cls.name == flow_name)
+        items = cls.select().where(cls.name == flow_name).order_by(cls.worktime_ts)
         if items:
             return items.get()
 
@@ -135,7 +215,7 @@ class FlowItem(BaseDBModel):
         items = cls.select().where(cls.name == flow_name)
 
         if for_updated:
-            items = items.order_by(cls.worktime.desc())
+            items = items.order_by(cls.worktime_ts.desc())
         else:
             items = items.order_by(cls.updated_utc.desc())
 
@@ -158,10 +238,10 @@ class FlowItem(BaseDBModel):
             query = query.where(cls.status.in_(filter_statuses))
 
         if from_time:
-            query = query.where(cls.worktime >= from_time)
+            query = query.where(cls.worktime_ts >= from_time)
 
         if to_time:
-            query = query.where(cls.worktime <= to_time)
+            query = query.where(cls.worktime_ts <= to_time)
 
         return query.execute()
 
@@ -175,11 +255,104 @@ class FlowItem(BaseDBModel):
         to_time: dt.datetime,
     ) -> int:
         query = cls.update(**{cls.expires_utc.name: expires}).where(
-            cls.name == flow_name, cls.worktime >= from_time, cls.worktime <= to_time
+            cls.name == flow_name,
+            cls.worktime_ts >= from_time,
+            cls.worktime_ts <= to_time,
+        )
+
+        return query.execute()
+
+    @classmethod
+    def is_lease_expired(cls) -> peewee.Expression:
+        return cls.lease_expires_utc < pendulum.now("UTC")
+
+    @classmethod
+    def claim_items(
+        cls,
+        flow_name: str,
+        *,
+        from_time: dt.datetime,
+        to_time: dt.datetime,
+        owner: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+    ) -> int:
+        """
+        Atomically takes the items for execution.
+        New items and items whose owner has not renewed the lease are taken,
+        so the item is executed by only one executor process.
+        Returns the number of claimed items.
+        """
+        lease_seconds = lease_seconds or Settings.ITEM_LEASE_SECONDS
+        query = cls.update(
+            **{
+                cls.status.name: Statuses.run,
+                cls.lease_owner.name: owner or get_node_id(),
+                cls.lease_expires_utc.name: pendulum.now("UTC").add(
+                    seconds=lease_seconds
+                ),
+            }
+        ).where(
+            cls.name == flow_name,
+            cls.worktime_ts >= from_time,
+            cls.worktime_ts <= to_time,
+            (
+                (cls.status == Statuses.add)
+                | ((cls.status == Statuses.run) & cls.is_lease_expired())
+            ),
+        )
+
+        return query.execute()
+
+    @classmethod
+    def take_over_lease(
+        cls,
+        flow_name: str,
+        *,
+        from_time: dt.datetime,
+        to_time: dt.datetime,
+        from_owner: str,
+        owner: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+    ) -> int:
+        """
+        The node that executes the items takes the lease over from the node that ordered them,
+        so that the items of a crashed node are reclaimed when its own lease expires.
+        Returns 0 if the lease has already been claimed by another node.
+        """
+        lease_seconds = lease_seconds or Settings.ITEM_LEASE_SECONDS
+        query = cls.update(
+            **{
+                cls.lease_owner.name: owner or get_node_id(),
+                cls.lease_expires_utc.name: pendulum.now("UTC").add(
+                    seconds=lease_seconds
+                ),
+            }
+        ).where(
+            cls.name == flow_name,
+            cls.worktime_ts >= from_time,
+            cls.worktime_ts <= to_time,
+            cls.status == Statuses.run,
+            cls.lease_owner == from_owner,
         )
 
         return query.execute()
 
+    @classmethod
+    def renew_leases(
+        cls, owner: Optional[str] = None, lease_seconds: Optional[int] = None
+    ) -> int:
+        """Heartbeat of the executor process, extends the lease of all its items."""
+        lease_seconds = lease_seconds or Settings.ITEM_LEASE_SECONDS
+        query = cls.update(
+            **{
+                cls.lease_expires_utc.name: pendulum.now("UTC").add(
+                    seconds=lease_seconds
+                )
+            }
+        ).where(cls.lease_owner == (owner or get_node_id()), cls.status == Statuses.run)
+
+        return query.execute()
+
     @classmethod
     def recreate_item(
         cls,
@@ -199,10 +372,10 @@ class FlowItem(BaseDBModel):
     ) -> list["FlowItem"]:
         query = cls.select().where(cls.name == flow_name)
         if from_time:
-            query = query.where(cls.worktime >= from_time)
+            query = query.where(cls.worktime_ts >= from_time)
 
         if to_time:
-            query = query.where(cls.worktime <= to_time)
+            query = query.where(cls.worktime_ts <= to_time)
 
         if filter_statuses:
             query = query.where(cls.status.in_(filter_statuses))
@@ -234,10 +407,14 @@ class FlowItem(BaseDBModel):
     ) -> int:
         query = cls.delete().where(cls.name == flow_name)
         if from_time:
-            query = query.where(cls.worktime >= from_time)
+            query = query.where(cls.worktime_ts >= from_time)
 
         if to_time:
-            query = query.where(cls.worktime <= to_time)
+            query = query.where(cls.worktime_ts <= to_time)
+
+        if from_time is None and to_time is None:
+            # The flow will start from the beginning, including the archived period.
+            FlowItemArchive.delete().where(FlowItemArchive.name == flow_name).execute()
 
         return query.execute()
 
@@ -272,20 +449,69 @@ class FlowItem(BaseDBModel):
         end_time: dt.datetime,
         interval_timedelta: dt.timedelta,
     ) -> list["FlowItem"]:
-        items = []
-        for datetime_ in iter_range_datetime(start_time, end_time, interval_timedelta):
-            try:
-                item = cls.create(
-                    **{cls.name.name: flow_name, cls.worktime.name: datetime_}
+        worktime_list = list(
+            iter_range_datetime(start_time, end_time, interval_timedelta)
+        )
+        existing = {
+            cls.worktime.db_value(item.worktime)
+            for item in cls._select_items(flow_name, worktime_list)
+        }
+        missing_worktimes = [
+            datetime_
+            for datetime_ in worktime_list
+            if cls.worktime.db_value(datetime_) not in existing
+        ]
+        if missing_worktimes:
+            cls._insert_items(flow_name, missing_worktimes)
+            logger.info(
+                "Created missing worktimes {} for {}", missing_worktimes, flow_name
+            )
+
+        return cls._select_items(flow_name, worktime_list)
+
+    @classmethod
+    def _insert_items(
+        cls,
+        flow_name: str,
+        worktime_list: list[dt.datetime],
+        update_existing: Optional[dict] = None,
+        **kwargs,
+    ) -> None:
+        """
+        Inserts items in batches.
+        Existing items are left as is or are updated with the update_existing fields.
+        """
+        rows = [
+            {cls.name.name: flow_name, cls.worktime.name: datetime_, **kwargs}
+            for datetime_ in worktime_list
+        ]
+        for batch in chunker(rows, cls.insert_batch_size):
+            query = cls.insert_many(batch)
+            if update_existing:
+                query = query.on_conflict(
+                    conflict_target=[cls.name, cls.worktime], update=update_existing
                 )
-            except peewee.IntegrityError:
-                item = cls.get(cls.name == flow_name, cls.worktime == datetime_)
             else:
-                logger.info("Created missing worktime {} for {}", datetime_, flow_name)
+                query = query.on_conflict_ignore()
+            query.execute()
 
-            items.append(item)
+    @classmethod
+    def _select_items(
+        cls, flow_name: str, worktime_list: list[dt.datetime]
+    ) -> list["FlowItem"]:
+        """Selects the items in one query, in the order of the worktime list."""
+        if not worktime_list:
+            return []
 
-        return items
+        keys = [cls.worktime.db_value(datetime_) for datetime_ in worktime_list]
+        query = cls.select().where(
+            cls.name == flow_name,
+            cls.worktime_ts >= min(worktime_list),
+            cls.worktime_ts <= max(worktime_list),
+        )
+        items = {cls.worktime.db_value(item.worktime): item for item in query}
+
+        return [items[key] for key in keys if key in items]
 
     @classmethod
     def recreate_prev_items(
@@ -359,39 +585,44 @@ class FlowItem(BaseDBModel):
         else:
             return True
 
+    @classmethod
+    def _retry_error_items_filter(
+        cls, flow_name: str, retries: int, retry_delay: int
+    ) -> peewee.Expression:
+        # Items finished earlier than retry_delay ago are restarted.
+        last_finish_time = pendulum.now("UTC").subtract(seconds=retry_delay)
+        return (
+            (cls.name == flow_name)
+            & (cls.status.in_(Statuses.error_statuses))
+            & (cls.retries < retries)
+            & ((cls.finished_utc <= last_finish_time) | (cls.finished_utc.is_null()))
+            # TODO: В поле info записывать, что поток не будет перезапущен, т.к. истек срок выполнения.
+            #  Иначе не понятно, почему не перезапускаются.
+            & ((cls.expires_utc >= pendulum.now("UTC")) | (cls.expires_utc.is_null()))
+        )
+
+    @classmethod
+    def _retry_error_items_values(cls) -> dict:
+        return {
+            cls.status.name: Statuses.add,
+            cls.retries.name: cls.retries + 1,
+            cls.updated_utc.name: pendulum.now("UTC"),
+        }
+
     @classmethod
     def retry_error_items(
         cls, flow_name: str, retries: int, retry_delay: int
     ) -> peewee.ModelSelect:
-        # http://docs.peewee-orm.com/en/latest/peewee/hacks.html?highlight=time%20now#date-math
-        # A function that checks to see if retry_delay passes to restart.
-        next_start_time_timestamp = cls.finished_utc.to_timestamp() + retry_delay
         items = cls.select().where(
-            cls.name == flow_name,
-            cls.status.in_(Statuses.error_statuses),
-            cls.retries < retries,
-            (
-                (pendulum.now("UTC").timestamp() >= next_start_time_timestamp)
-                | (cls.finished_utc.is_null())
-            ),
-            # TODO: В поле info записывать, что поток не будет перезапущен, т.к. истек срок выполнения.
-            #  Иначе не понятно, почему не перезапускаются.
-            (
-                (pendulum.now("UTC").timestamp() <= cls.expires_utc.to_timestamp())
-                | (cls.expires_utc.is_null())
-            ),
+            cls._retry_error_items_filter(flow_name, retries, retry_delay)
         )
         worktimes = [i.worktime for i in items]
 
         if worktimes:
             # TODO: recreate items
-            cls.update(
-                **{
-                    cls.status.name: Statuses.add,
-                    cls.retries.name: cls.retries + 1,
-                    cls.updated_utc.name: pendulum.now("UTC"),
-                }
-            ).where(cls.name == flow_name, cls.worktime.in_(worktimes)).execute()
+            cls.update(**cls._retry_error_items_values()).where(
+                cls.name == flow_name, cls.worktime.in_(worktimes)
+            ).execute()
 
             logger.info(
                 "Restart error items for {}, worktimes = {}", flow_name, worktimes
@@ -400,7 +631,69 @@ class FlowItem(BaseDBModel):
         return (
             cls.select()
             .where(cls.name == flow_name, cls.worktime.in_(worktimes))
-            .order_by(cls.worktime.desc())
+            .order_by(cls.worktime_ts.desc())
+        )
+
+    @classmethod
+    def _scheduling_state(cls, flow_name: str) -> dict:
+        """
+        The last item, the number of fatal errors and the archive of the flow in one query.
+        """
+        item = cls.alias("item")
+        fatal_errors = item.select(peewee.fn.COUNT(item.name)).where(
+            item.name == flow_name, item.status == Statuses.fatal_error
+        )
+        archived_worktime = FlowItemArchive.select(FlowItemArchive.worktime).where(
+            FlowItemArchive.name == flow_name
+        )
+        last_item = (
+            cls.select(cls.worktime, cls.notebook_hash)
+            .where(cls.name == flow_name)
+            .order_by(cls.worktime_ts.desc())
+            .limit(1)
+        )
+        state = (
+            peewee.Select(
+                columns=[
+                    last_item.select(cls.worktime).alias("last_worktime"),
+                    last_item.select(cls.notebook_hash).alias("last_notebook_hash"),
+                    fatal_errors.alias("fatal_errors"),
+                    archived_worktime.alias("archived_worktime"),
+                ]
+            )
+            .bind(cls._meta.database)
+            .dicts()
+            .get()
+        )
+        for key in ("last_worktime", "archived_worktime"):
+            if state[key] is not None:
+                state[key] = cls.worktime.python_value(state[key])
+
+        return state
+
+    @classmethod
+    def _is_sequence_complete(
+        cls, flow_name: str, worktime_list: list[dt.datetime]
+    ) -> bool:
+        """
+        Compares the number and the sum of the worktimes in the range with the expected ones,
+        so as not to select all the items of the range.
+        """
+        if not worktime_list:
+            return True
+
+        count, total = (
+            cls.select(peewee.fn.COUNT(cls.name), peewee.fn.SUM(cls.worktime_ts))
+            .where(
+                cls.name == flow_name,
+                cls.worktime_ts >= worktime_list[0],
+                cls.worktime_ts <= worktime_list[-1],
+            )
+            .tuples()
+            .get()
+        )
+        return count == len(worktime_list) and total == sum(
+            cls.worktime_ts.db_value(datetime_) for datetime_ in worktime_list
         )
 
     @classmethod
@@ -419,16 +712,32 @@ class FlowItem(BaseDBModel):
             Union[pydantic.PositiveInt, list[pydantic.NegativeInt]]
         ] = None,
     ) -> Optional[list["FlowItem"]]:
-        if cls.allow_execute_flow(
-            flow_name, notebook_hash=notebook_hash, max_fatal_errors=max_fatal_errors
-        ):
-            if not cls.exists(flow_name):
-                cls.create(**{cls.name.name: flow_name, cls.worktime.name: worktime})
+        """
+        Creates the items that are due and returns the items for execution.
+        Without new items, these are the state query, the retry update
+        and the select of the items, all in one transaction.
+        """
+        with atomic(cls._meta.database):
+            state = cls._scheduling_state(flow_name)
+
+            if (
+                state["last_notebook_hash"] == notebook_hash
+                and state["fatal_errors"] >= max_fatal_errors
+            ):
+                logger.info("Many fatal errors, {} will not be scheduled", flow_name)
+                return None
+
+            if state["last_worktime"] is None:
+                cls._insert_items(flow_name, [worktime])
                 logger.info(
                     "Created first item for {}, worktime {}", flow_name, worktime
                 )
 
-            if cls.create_next_execute_item(flow_name, interval_timedelta, worktime):
+            elif worktime - state["last_worktime"] >= interval_timedelta:
+                next_worktime = state["last_worktime"] + interval_timedelta
+                cls._insert_items(flow_name, [next_worktime])
+                logger.info("Created next worktime {} for {}", next_worktime, flow_name)
+
                 if update_stale_data:
                     # When creating the next item, elements are created to update the data for the past dates.
                     cls.recreate_prev_items(
@@ -436,26 +745,42 @@ class FlowItem(BaseDBModel):
                     )
 
             if keep_sequence:
-                cls.create_missing_items(
-                    flow_name, start_time, worktime, interval_timedelta
+                archived_worktime = state["archived_worktime"]
+                if archived_worktime and archived_worktime >= start_time:
+                    # The archived items are not created again.
+                    start_time = archived_worktime + interval_timedelta
+
+                worktime_list = list(
+                    iter_range_datetime(start_time, worktime, interval_timedelta)
                 )
+                if not cls._is_sequence_complete(flow_name, worktime_list):
+                    cls.create_missing_items(
+                        flow_name, start_time, worktime, interval_timedelta
+                    )
 
-            cls.retry_error_items(flow_name, retries, retry_delay)
+            count = (
+                cls.update(**cls._retry_error_items_values())
+                .where(cls._retry_error_items_filter(flow_name, retries, retry_delay))
+                .execute()
+            )
+            if count:
+                logger.info("Restart {} error items for {}", count, flow_name)
 
-            return (
+            return list(
                 cls.select()
                 .where(
                     cls.name == flow_name,
-                    cls.status == Statuses.add,
                     (
-                        (
-                            pendulum.now("UTC").timestamp()
-                            <= cls.expires_utc.to_timestamp()
-                        )
+                        (cls.status == Statuses.add)
+                        # The owner of the item has not renewed the lease, it may have crashed.
+                        | ((cls.status == Statuses.run) & cls.is_lease_expired())
+                    ),
+                    (
+                        (cls.expires_utc >= pendulum.now("UTC"))
                         | (cls.expires_utc.is_null())
                     ),
                 )
-                .order_by(cls.worktime.desc())
+                .order_by(cls.worktime_ts.desc())
             )
 
     @classmethod
@@ -463,34 +788,33 @@ class FlowItem(BaseDBModel):
         cls.update(
             **{cls.status.name: Statuses.error, cls.info.name: "ExpiredError"}
         ).where(
-            pendulum.now("UTC").timestamp() >= cls.expires_utc.to_timestamp()
+            cls.status.in_([Statuses.add, Statuses.run]),
+            cls.expires_utc <= pendulum.now("UTC"),
         ).execute()
 
+        # Only items whose lease has expired are returned,
+        # the rest can be executed by other executor processes.
         cls.update(**{cls.status.name: Statuses.add}).where(
-            cls.status.in_([Statuses.run])
+            cls.status == Statuses.run,
+            cls.lease_expires_utc.is_null() | cls.is_lease_expired(),
         ).execute()
 
     @classmethod
     def create_items(
         cls, flow_name: str, worktime_list: Iterable[dt.datetime], **kwargs
     ) -> list["FlowItem"]:
-        items = []
-        for datetime_ in worktime_list:
-            try:
-                item = cls.create(
-                    **{
-                        cls.name.name: flow_name,
-                        cls.worktime.name: datetime_,
-                        **kwargs,
-                    },
-                )
-            except peewee.IntegrityError:
-                item = cls.get(cls.name == flow_name, cls.worktime == datetime_)
-                cls.update_items([item], **kwargs)
-
-            items.append(item)
+        worktime_list = list(worktime_list)
+        update_existing = {
+            getattr(cls, field): value
+            for field, value in kwargs.items()
+            if field in cls.__dict__
+        }
+        update_existing[cls.updated_utc] = pendulum.now("UTC")
+        cls._insert_items(
+            flow_name, worktime_list, update_existing=update_existing, **kwargs
+        )
 
-        return items
+        return cls._select_items(flow_name, worktime_list)
 
     @classmethod
     def update_items(
@@ -521,6 +845,74 @@ class FlowItem(BaseDBModel):
 
         return not_saved_data
 
+    @classmethod
+    def bulk_update_items(cls, items: list["FlowItem"], **kwargs) -> int:
+        """
+        Updates the items with one query per flow, instead of saving each item.
+        The values are also set on the passed item objects.
+        """
+        kwargs = {
+            field: value for field, value in kwargs.items() if field in cls.__dict__
+        }
+        kwargs[cls.updated_utc.name] = pendulum.now("UTC")
+
+        worktimes_by_name = defaultdict(list)
+        for item in items:
+            worktimes_by_name[item.name].append(item.worktime)
+            for field, value in kwargs.items():
+                if not isinstance(value, peewee.Expression):
+                    setattr(item, field, value)
+
+        count = 0
+        for flow_name, worktime_list in worktimes_by_name.items():
+            for batch in chunker(worktime_list, cls.update_batch_size):
+                count += (
+                    cls.update(**kwargs)
+                    .where(cls.name == flow_name, cls.worktime.in_(batch))
+                    .execute()
+                )
+
+        return count
+
+    @classmethod
+    def archive_items(
+        cls, flow_name: str, to_time: dt.datetime, path: Union[str, Path]
+    ) -> int:
+        """
+        Moves the successful items with worktime up to to_time
+        to the end of the compressed JSONL file. Returns the number of moved items.
+        """
+        items = list(
+            cls.select()
+            .where(
+                cls.name == flow_name,
+                cls.status == Statuses.success,
+                cls.worktime_ts <= to_time,
+            )
+            .order_by(cls.worktime_ts)
+            .dicts()
+        )
+        if not items:
+            return 0
+
+        with gzip.open(path, "ab") as file:
+            for item in items:
+                file.write(orjson.dumps(item, default=custom_encoder) + b"\n")
+
+        worktime_list = [item[cls.worktime.name] for item in items]
+        for batch in chunker(worktime_list, cls.update_batch_size):
+            # Items restarted after the select are left.
+            cls.delete().where(
+                cls.name == flow_name,
+                cls.status == Statuses.success,
+                cls.worktime.in_(batch),
+            ).execute()
+
+        FlowItemArchive.add(flow_name, worktime_list[-1], len(items))
+        logger.info("Archived {} items of {} to {}", len(items), flow_name, path)
+
+        return len(items)
+
     @classmethod
     def iter_items(
         cls,
@@ -532,7 +924,7 @@ class FlowItem(BaseDBModel):
         query = (
             FlowItem.select()
             .where(FlowItem.name == flow_name)
-            .order_by(cls.worktime.desc())
+            .order_by(cls.worktime_ts.desc())
             .limit(limit)
             .offset(offset)
         )
@@ -542,4 +934,224 @@ class FlowItem(BaseDBModel):
         return query
 
 
-db.create_tables([FlowItem])
+class FlowItemArchive(BaseDBModel):
+    """Up to which worktime the items of the flow have been moved to the archive."""
+
+    name = playhouse.sqlite_ext.CharField(primary_key=True)
+    worktime = DateTimeTZField()
+    count = playhouse.sqlite_ext.IntegerField(default=0)
+    updated_utc = DateTimeUTCField(null=True)
+
+    @classmethod
+    def add(cls, flow_name: str, worktime: dt.datetime, count: int) -> None:
+        archive = cls.get_or_none(cls.name == flow_name)
+        if archive is None:
+            cls.create(
+                **{
+                    cls.name.name: flow_name,
+                    cls.worktime.name: worktime,
+                    cls.count.name: count,
+                    cls.updated_utc.name: pendulum.now("UTC"),
+                }
+            )
+        else:
+            archive.worktime = max(archive.worktime, worktime)
+            archive.count += count
+            archive.updated_utc = pendulum.now("UTC")
+            archive.save()
+
+
+class FlowStatusCounter(BaseDBModel):
+    """
+    Number of items of the flow in each status.
+    It is maintained by the triggers on the FlowItem table,
+    so the counts are read without scanning the items.
+    """
+
+    name = playhouse.sqlite_ext.CharField()
+    status = playhouse.sqlite_ext.CharField()
+    count = playhouse.sqlite_ext.IntegerField(default=0)
+
+    class Meta:
+        primary_key = playhouse.sqlite_ext.CompositeKey("name", "status")
+
+    @classmethod
+    def counts(
+        cls, database: Optional[peewee.Database] = None
+    ) -> dict[tuple[str, Statuses.LiteralT], int]:
+        query = cls.select().bind(database or cls._meta.database)
+        return {(item.name, item.status): item.count for item in query}
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """Counts the items again, for tables created before the triggers."""
+        with cls._meta.database.atomic():
+            cls.delete().execute()
+            cls.insert_from(
+                FlowItem.select(
+                    FlowItem.name, FlowItem.status, peewee.fn.COUNT(FlowItem.name)
+                ).group_by(FlowItem.name, FlowItem.status),
+                fields=[cls.name, cls.status, cls.count],
+            ).execute()
+
+
+def create_status_counter_triggers(database: peewee.Database) -> None:
+    items = FlowItem._meta.table_name
+    counters = FlowStatusCounter._meta.table_name
+    increment = (
+        f'INSERT INTO "{counters}" (name, status, count) VALUES (NEW.name, NEW.status, 1) '
+        f'ON CONFLICT (name, status) DO UPDATE SET count = "{counters}".count + 1;'
+    )
+    decrement = (
+        f'UPDATE "{counters}" SET count = count - 1 '
+        f"WHERE name = OLD.name AND status = OLD.status;"
+    )
+
+    if isinstance(database, peewee.SqliteDatabase):
+        database.execute_sql(
+            f'CREATE TRIGGER IF NOT EXISTS "{items}_counter_insert" '
+            f'AFTER INSERT ON "{items}" BEGIN {increment} END'
+        )
+        database.execute_sql(
+            f'CREATE TRIGGER IF NOT EXISTS "{items}_counter_delete" '
+            f'AFTER DELETE ON "{items}" BEGIN {decrement} END'
+        )
+        database.execute_sql(
+            f'CREATE TRIGGER IF NOT EXISTS "{items}_counter_update" '
+            f'AFTER UPDATE OF name, status ON "{items}" '
+            f"WHEN OLD.name IS NOT NEW.name OR OLD.status IS NOT NEW.status "
+            f"BEGIN {decrement} {increment} END"
+        )
+    else:
+        with database.atomic():
+            database.execute_sql(
+                f'CREATE OR REPLACE FUNCTION "{items}_counter"() RETURNS trigger AS $$ '
+                f"BEGIN "
+                f"IF TG_OP = 'UPDATE' AND OLD.name = NEW.name AND OLD.status = NEW.status THEN "
+                f"RETURN NULL; END IF; "
+                f"IF TG_OP IN ('UPDATE', 'DELETE') THEN {decrement} END IF; "
+                f"IF TG_OP IN ('UPDATE', 'INSERT') THEN {increment} END IF; "
+                f"RETURN NULL; "
+                f"END $$ LANGUAGE plpgsql"
+            )
+            database.execute_sql(
+                f'DROP TRIGGER IF EXISTS "{items}_counter" ON "{items}"'
+            )
+            database.execute_sql(
+                f'CREATE TRIGGER "{items}_counter" '
+                f'AFTER INSERT OR DELETE OR UPDATE OF name, status ON "{items}" '
+                f'FOR EACH ROW EXECUTE PROCEDURE "{items}_counter"()'
+            )
+
+
+def atomic(database: peewee.Database = db) -> ContextManager:
+    """
+    Transaction of the database.
+    The SQLite queue database does not support them, it executes the writes one by one itself.
+    """
+    if isinstance(database, SqliteQueueDatabase):
+        return nullcontext()
+
+    return database.atomic()
+
+
+@contextmanager
+def migration_database(database: peewee.Database = db) -> Iterator[peewee.Database]:
+    """
+    A synchronous connection for the migrations,
+    the SQLite queue database executes the writes in the background thread.
+    """
+    if not isinstance(database, SqliteQueueDatabase):
+        yield database
+        return
+
+    database = playhouse.sqlite_ext.SqliteExtDatabase(
+        database.database,
+        timeout=30,
+        # The same mode as the writer thread, otherwise they wait for each other.
+        pragmas=(("journal_mode", "wal"),),
+    )
+    try:
+        yield database
+    finally:
+        database.close()
+
+
+def add_missing_columns(model: type[BaseDBModel], database: peewee.Database) -> None:
+    """Adds new fields of the model to the table created by an older version."""
+    from playhouse.migrate import SchemaMigrator, migrate
+
+    table_name = model._meta.table_name
+    columns = {column.name for column in database.get_columns(table_name)}
+    migrator = SchemaMigrator.from_database(database)
+    operations = [
+        migrator.add_column(table_name, field.column_name, field)
+        for field in model._meta.sorted_fields
+        if field.column_name not in columns
+    ]
+    if operations:
+        migrate(*operations)
+
+
+def migrate_to_epoch_storage(database: playhouse.sqlite_ext.SqliteExtDatabase) -> None:
+    """
+    Converts the table of an older version,
+    where the UTC fields were stored as ISO strings and the worktime only as text.
+    """
+    table_name = FlowItem._meta.table_name
+    worktime_ts = FlowItem.worktime_ts.column_name
+    worktime = FlowItem.worktime.column_name
+    utc_field = DateTimeUTCField()
+
+    # The values are converted by Python functions inside SQLite, one UPDATE per column.
+    database.register_function(
+        lambda value: FlowItem.worktime_ts.db_value(
+            FlowItem.worktime.python_value(value)
+        ),
+        "worktime_to_timestamp",
+        1,
+    )
+    database.register_function(
+        lambda value: utc_field.db_value(utc_field.python_value(value)),
+        "utc_to_timestamp",
+        1,
+    )
+    with database.atomic():
+        database.execute_sql(
+            f'UPDATE "{table_name}" SET "{worktime_ts}" = worktime_to_timestamp("{worktime}") '
+            f'WHERE "{worktime_ts}" IS NULL'
+        )
+        for field in FlowItem._meta.sorted_fields:
+            if isinstance(field, DateTimeUTCField):
+                database.execute_sql(
+                    f'UPDATE "{table_name}" SET "{field.column_name}" = utc_to_timestamp("{field.column_name}") '
+                    f"WHERE typeof(\"{field.column_name}\") = 'text'"
+                )
+
+
+def create_tables(database: peewee.Database = db) -> None:
+    """Creates the tables or migrates the tables of an older version."""
+    models = [FlowItem, FlowItemArchive, FlowStatusCounter]
+    with migration_database(database) as database, database.bind_ctx(models):
+        if FlowItem.table_exists():
+            # The new columns are needed before the indexes on them are created.
+            add_missing_columns(FlowItem, database)
+            if isinstance(database, peewee.SqliteDatabase):
+                # Older versions only worked with SQLite.
+                migrate_to_epoch_storage(database)
+
+        is_new_counters = not FlowStatusCounter.table_exists()
+        database.create_tables(models)
+        create_status_counter_triggers(database)
+        if is_new_counters:
+            FlowStatusCounter.rebuild()
+
+
+def vacuum(database: peewee.Database = db) -> None:
+    """Returns the space of the deleted rows to the file system, SQLite does not do it itself."""
+    if isinstance(database, peewee.SqliteDatabase):
+        with migration_database(database) as database:
+            database.execute_sql("VACUUM")
+
+
+create_tables()
@@ -125,4 +125,4 @@ class BaseOperator:
         kwargs["dry_run"] = True
         for item in self(*args, **kwargs):
             if isinstance(item, SleepIteration):
-                time.sleep(item.rest_of_sleep())
+                time.sleep(max(0.0, item.wake_up_time - time.monotonic()))
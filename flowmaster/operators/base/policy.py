@@ -115,6 +115,8 @@ class BaseNotebook(BaseModel, ABC):
         time_limit_seconds_from_worktime: Optional[int] = None
         soft_time_limit_seconds: Optional[int] = None
         max_fatal_errors: int = 3
+        # Successful items older than this are moved to the archive by "flowmaster db compact".
+        retention_days: Optional[PositiveInt] = None
 
     name: str
     description: Optional[str] = None
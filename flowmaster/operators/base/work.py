@@ -1,4 +1,6 @@
 import datetime as dt
+import threading
+from concurrent.futures import Executor
 from contextlib import contextmanager
 from typing import Iterator, Optional, TYPE_CHECKING
 
@@ -6,10 +8,12 @@ import pendulum
 
 from flowmaster.enums import Statuses
 from flowmaster.models import FlowItem
+from flowmaster.setttings import Settings
 from flowmaster.utils import iter_range_datetime, iter_period_from_range
 from flowmaster.utils.logging_helper import Logger, getLogger
 
 if TYPE_CHECKING:
+    from flowmaster.broker import BaseBroker
     from flowmaster.operators.base.policy import BaseNotebook
     from flowmaster.operators.etl.core import BaseOperator
     from flowmaster.executors import ExecutorIterationTask
@@ -104,18 +108,72 @@ class Work:
         )
 
 
+class FlowDueIndex:
+    """
+    The time after which the flow may have something to execute.
+    Until it comes, the flow is skipped when ordering, without queries to the database.
+    The flow is due when its next worktime comes, when a retry of the failed items is expected,
+    when the notebook has changed and at least every SCHEDULER_RECHECK_SECONDS,
+    so that changes made by other processes are not missed.
+    """
+
+    def __init__(self):
+        self._due: dict[str, tuple[str, pendulum.DateTime]] = {}
+        self._lock = threading.Lock()
+
+    def is_due(self, notebook: "BaseNotebook") -> bool:
+        with self._lock:
+            notebook_hash, due_time = self._due.get(notebook.name, (None, None))
+
+        if notebook_hash != notebook.hash:
+            return True
+
+        return pendulum.now("UTC") >= due_time
+
+    def update(self, work: "Work") -> None:
+        """Calculates the due time after the flow has been ordered."""
+        next_worktime = work.current_worktime + work.interval_timedelta
+        if work.is_second_interval is False:
+            # The worktime lags behind the current time by one interval.
+            next_worktime += work.interval_timedelta
+
+        due_time = min(
+            pendulum.instance(next_worktime).in_timezone("UTC"),
+            pendulum.now("UTC").add(seconds=Settings.SCHEDULER_RECHECK_SECONDS),
+        )
+        with self._lock:
+            self._due[work.name] = (work.notebook.hash, due_time)
+
+    def mark_due(self, name: str, due_time: Optional[dt.datetime] = None) -> None:
+        """Brings forward the check of the flow, for example, for a retry or a restart."""
+        due_time = pendulum.instance(due_time or pendulum.now("UTC"))
+        with self._lock:
+            if name in self._due:
+                notebook_hash, current_due_time = self._due[name]
+                self._due[name] = (notebook_hash, min(current_due_time, due_time))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._due.clear()
+
+
+flow_due_index = FlowDueIndex()
+
+
 @contextmanager
 def prepare_items_for_order(
-    flow: "BaseOperator", start_period: dt.datetime, end_period: dt.datetime
-):
-    # The status is changed so that there is no repeated ordering of tasks.
-    FlowItem.change_status(
-        flow.notebook.name,
-        new_status=Statuses.run,
-        from_time=start_period,
-        to_time=end_period,
+    flow: "BaseOperator",
+    start_period: dt.datetime,
+    end_period: dt.datetime,
+    *,
+    owner: Optional[str] = None,
+) -> Iterator[int]:
+    # The items are claimed so that there is no repeated ordering of tasks,
+    # including by other executor processes.
+    claimed = FlowItem.claim_items(
+        flow.notebook.name, from_time=start_period, to_time=end_period, owner=owner
     )
-    if flow.Work.expires is not None:
+    if claimed and flow.Work.expires is not None:
         FlowItem.change_expires(
             flow.notebook.name,
             expires=flow.Work.expires,
@@ -123,10 +181,32 @@ def prepare_items_for_order(
             to_time=end_period,
         )
 
-    yield
+    yield claimed
 
 
-def ordering_flow_tasks(*, dry_run: bool = False) -> Iterator["ExecutorIterationTask"]:
-    from flowmaster.operators.etl.work import ordering_etl_flow_tasks
+def ordering_flow_tasks(
+    *,
+    dry_run: bool = False,
+    transform_executor: Optional[Executor] = None,
+    broker: Optional["BaseBroker"] = None,
+    batch_size: Optional[int] = None,
+) -> Iterator["ExecutorIterationTask"]:
+    from flowmaster.operators.etl.work import (
+        ordering_etl_flow_tasks,
+        ordering_etl_flow_tasks_through_broker,
+    )
+
+    # Heartbeat of the ordered items, so that other processes do not take them.
+    FlowItem.renew_leases(broker.node_id if broker is not None else None)
 
-    yield from ordering_etl_flow_tasks(dry_run=dry_run)
+    if broker is None:
+        yield from ordering_etl_flow_tasks(
+            dry_run=dry_run, transform_executor=transform_executor
+        )
+    else:
+        yield from ordering_etl_flow_tasks_through_broker(
+            broker=broker,
+            dry_run=dry_run,
+            transform_executor=transform_executor,
+            batch_size=batch_size,
+        )
@@ -1,6 +1,8 @@
 import datetime as dt
+import threading
 import time
-from typing import Iterator, Union, Optional
+from concurrent.futures import Executor
+from typing import Callable, Iterator, Union, Optional
 
 import pendulum
 
@@ -12,11 +14,18 @@ from flowmaster.executors import (
     AsyncIterationT,
 )
 from flowmaster.operators.base.core import BaseOperator
-from flowmaster.operators.etl.dataschema import ETLContext
+from flowmaster.operators.base.work import flow_due_index
+from flowmaster.operators.etl.dataschema import (
+    ETLContext,
+    ExportContext,
+    TransformContext,
+)
 from flowmaster.operators.etl.enums import ETLSteps
 from flowmaster.operators.etl.loaders import Loaders
+from flowmaster.operators.etl.pipeline import ETLPipeline
 from flowmaster.operators.etl.policy import ETLNotebook
 from flowmaster.operators.etl.providers import Providers
+from flowmaster.operators.etl.transform.service import transform_in_process
 from flowmaster.operators.etl.work import ETLWork
 from flowmaster.utils import iter_range_datetime
 from flowmaster.utils.logging_helper import create_logfile
@@ -26,12 +35,21 @@ class ETLOperator(BaseOperator):
     name = "etl"
     work_class = ETLWork
     items = None
+    # Progress is written to the database no more often than this interval in seconds,
+    # only the latest state is written. Status changes are written immediately.
+    items_update_interval = 0.5
+    # Number of chunks waiting between the steps in the pipeline mode.
+    pipeline_queue_size = 1
     Providers = Providers
     Loaders = Loaders
 
-    def __init__(self, notebook: ETLNotebook):
+    def __init__(
+        self, notebook: ETLNotebook, *, transform_executor: Optional[Executor] = None
+    ):
         super(ETLOperator, self).__init__(notebook)
         self.notebook: ETLNotebook
+        # For example ProcessPoolExecutor, so that the transformation is not limited by GIL.
+        self.transform_executor = transform_executor
 
         self.Provider = Providers(notebook, self.logger)
         self.Load = Loaders(notebook, self.logger)
@@ -89,57 +107,10 @@ class ETLOperator(BaseOperator):
                 export_iterator = self.Provider.Export(
                     start_period, end_period, **kwargs
                 )
-                while True:
-                    # Export step.
-                    self.operator_context.step = ETLSteps.export
-                    yield {
-                        self.Model.data.name: self.operator_context.dict(
-                            exclude_unset=True
-                        )
-                    }
-                    yield NextIterationInPools(pool_names=self.export_pool_names)
-                    try:
-                        result = next(export_iterator)
-
-                        if isinstance(result, SleepIteration):
-                            sleep_task = result
-                            yield sleep_task
-                            continue
-
-                    except StopIteration:
-                        # Successful completion of the flow.
-                        break
-
-                    # Transform step.
-                    self.operator_context.step = ETLSteps.transform
-                    self.operator_context.export_kwargs.update(
-                        {**kwargs, **result.request_kwargs}
-                    )
-                    yield {
-                        self.Model.data.name: self.operator_context.dict(
-                            exclude_unset=True
-                        ),
-                    }
-                    yield NextIterationInPools(
-                        pool_names=self.transform_pool_names
-                    )
-                    transform_context = self.Provider.Transform(result)
-
-                    # Load step.
-                    self.operator_context.step = ETLSteps.load
-                    self.operator_context.size += transform_context.size
-                    self.operator_context.number_rows += len(transform_context.data)
-                    self.operator_context.number_error_lines += len(
-                        transform_context.data_errors
-                    )
-                    yield {
-                        self.Model.data.name: self.operator_context.dict(
-                            exclude_unset=True
-                        ),
-                        "data_errors": transform_context.data_errors,
-                    }
-                    yield NextIterationInPools(pool_names=self.load_pool_names)
-                    load(transform_context)
+                if self.is_pipeline:
+                    yield from self._iter_pipeline(export_iterator, load, kwargs)
+                else:
+                    yield from self._iter_steps(export_iterator, load, kwargs)
 
         except FatalError as er:
             yield {
@@ -175,6 +146,138 @@ class ETLOperator(BaseOperator):
                     self.Model.duration.name: round(time.time() - begin_time) or 1,
                 }
 
+    def _iter_steps(
+        self, export_iterator: Iterator, load: Callable, kwargs: dict
+    ) -> Iterator[Union[dict, AsyncIterationT]]:
+        while True:
+            # Export step.
+            self.operator_context.step = ETLSteps.export
+            yield {self.Model.data.name: self.operator_context.dict(exclude_unset=True)}
+            yield NextIterationInPools(pool_names=self.export_pool_names)
+            try:
+                result = next(export_iterator)
+
+                if isinstance(result, SleepIteration):
+                    sleep_task = result
+                    yield sleep_task
+                    continue
+
+            except StopIteration:
+                # Successful completion of the flow.
+                break
+
+            # Transform step.
+            self.operator_context.step = ETLSteps.transform
+            self.operator_context.export_kwargs.update(
+                {**kwargs, **result.request_kwargs}
+            )
+            yield {
+                self.Model.data.name: self.operator_context.dict(exclude_unset=True),
+            }
+            yield NextIterationInPools(pool_names=self.transform_pool_names)
+            transform_context = self.transform(result)
+
+            # Load step.
+            self.operator_context.step = ETLSteps.load
+            self.operator_context.size += transform_context.size
+            self.operator_context.number_rows += len(transform_context.data)
+            self.operator_context.number_error_lines += len(
+                transform_context.data_errors
+            )
+            yield {
+                self.Model.data.name: self.operator_context.dict(exclude_unset=True),
+                "data_errors": transform_context.data_errors,
+            }
+            yield NextIterationInPools(pool_names=self.load_pool_names)
+            load(transform_context)
+
+    @property
+    def is_pipeline(self) -> bool:
+        return self.notebook.work is not None and self.notebook.work.pipeline
+
+    def _iter_pipeline(
+        self, export_iterator: Iterator, load: Callable, kwargs: dict
+    ) -> Iterator[Union[dict, AsyncIterationT]]:
+        """
+        The chunks are transformed and loaded in the threads of the pipeline,
+        while the next chunk is being exported.
+        """
+        progress_lock = threading.Lock()
+        data_errors = []
+
+        def transform(export_context: ExportContext) -> TransformContext:
+            transform_context = self.transform(export_context)
+            with progress_lock:
+                self.operator_context.size += transform_context.size
+                self.operator_context.number_rows += len(transform_context.data)
+                self.operator_context.number_error_lines += len(
+                    transform_context.data_errors
+                )
+                data_errors.extend(transform_context.data_errors)
+            return transform_context
+
+        def get_progress() -> dict:
+            with progress_lock:
+                progress = {
+                    self.Model.data.name: self.operator_context.dict(
+                        exclude_unset=True
+                    ),
+                    "data_errors": data_errors.copy(),
+                }
+                data_errors.clear()
+            return progress
+
+        with ETLPipeline(
+            transform,
+            load,
+            transform_pool_names=self.transform_pool_names,
+            load_pool_names=self.load_pool_names,
+            maxsize=self.pipeline_queue_size,
+            name=self.notebook.name,
+        ) as pipeline:
+            while True:
+                self.operator_context.step = ETLSteps.export
+                yield get_progress()
+                yield NextIterationInPools(pool_names=self.export_pool_names)
+                try:
+                    result = next(export_iterator)
+
+                    if isinstance(result, SleepIteration):
+                        sleep_task = result
+                        yield sleep_task
+                        continue
+
+                except StopIteration:
+                    break
+
+                self.operator_context.export_kwargs.update(
+                    {**kwargs, **result.request_kwargs}
+                )
+                # The slot of the export pool is released before waiting for the queue.
+                yield get_progress()
+                # The worker is not blocked while waiting for the steps,
+                # they may need a pool slot held by a task waiting for a worker.
+                while not pipeline.put_nowait(result):
+                    yield SleepIteration(sleep=pipeline.poll_interval)
+
+            # The last chunks are being transformed and loaded.
+            self.operator_context.step = ETLSteps.load
+            yield get_progress()
+            while not pipeline.finish_nowait():
+                yield SleepIteration(sleep=pipeline.poll_interval)
+            pipeline.join()
+
+        yield get_progress()
+
+    def transform(self, export_context: ExportContext) -> TransformContext:
+        if self.transform_executor is None:
+            return self.Provider.Transform(export_context)
+
+        future = self.transform_executor.submit(
+            transform_in_process, self.notebook, export_context
+        )
+        return future.result()
+
     @staticmethod
     def _get_period_text(start_period: dt.datetime, end_period: dt.datetime) -> str:
         if start_period == end_period:
@@ -221,20 +324,36 @@ class ETLOperator(BaseOperator):
         )
 
         log_data = {}
+        self._pending_update = {}
+        self._last_update_time = time.monotonic()
         try:
             self.logger.info("Start flow: {} {}", self.notebook.name, period_text)
 
             for item in self(start_period, end_period, dry_run=dry_run, **kwargs):
                 if isinstance(item, dict):
                     log_data = item
-                    self.Model.update_items(self.items, **log_data)
+                    self.update_items(
+                        log_data, force=self.Model.status.name in log_data
+                    )
                     self.logger.info("{}: {}", self.notebook.name, log_data)
 
+                if isinstance(item, SleepIteration) or (
+                    isinstance(item, NextIterationInPools) and not item.allow()
+                ):
+                    # The progress should not be lost while the flow is sleeping
+                    # or waiting for a slot in the pool.
+                    self.update_items({}, force=True)
+
                 if isinstance(item, (SleepIteration, NextIterationInPools)):
                     yield item
 
         except Exception:
             self.logger.exception("Fail flow: {}  {}", self.notebook.name, period_text)
+            # So that the scheduler checks the flow when it is time to retry.
+            flow_due_index.mark_due(
+                self.notebook.name,
+                pendulum.now("UTC").add(seconds=self.Work.retry_delay),
+            )
             if dry_run is False:
                 self.send_notifications(
                     **{
@@ -253,9 +372,20 @@ class ETLOperator(BaseOperator):
                 )
 
         finally:
-            self.Model.update_items(self.items)
+            self.update_items({}, force=True)
             self.logger.info("End flow: {}  {}", self.notebook.name, period_text)
 
+    def update_items(self, log_data: dict, *, force: bool = False) -> None:
+        """Coalesces updates of the items, so as not to write every step to the database."""
+        self._pending_update.update(log_data)
+        if force or (
+            self._pending_update
+            and time.monotonic() - self._last_update_time >= self.items_update_interval
+        ):
+            self.Model.bulk_update_items(self.items, **self._pending_update)
+            self._pending_update = {}
+            self._last_update_time = time.monotonic()
+
     def dry_run(
         self,
         start_period: dt.datetime,
@@ -1,5 +1,5 @@
 import datetime as dt
-from typing import Optional, Union
+from typing import Any, Iterator, Optional, Sequence, Union
 
 import pydantic
 
@@ -24,9 +24,61 @@ class ETLContext(OperatorContext):
     export_kwargs: dict = pydantic.Field(default_factory=dict)
 
 
+class ColumnarBatch:
+    """
+    Chunk of data stored by columns: one sequence of values for each column.
+    Passes from the export to the loader without creating an object for each row.
+    """
+
+    __slots__ = ("columns", "data")
+
+    def __init__(self, columns: Sequence[str], data: list[Sequence]):
+        if len(columns) != len(data):
+            raise ValueError(
+                "Number of columns does not match the data: "
+                f"{len(columns)} != {len(data)}"
+            )
+        if len({len(values) for values in data}) > 1:
+            raise ValueError("Columns of different lengths")
+
+        self.columns = list(columns)
+        self.data = data
+
+    @classmethod
+    def from_values(
+        cls, columns: Sequence[str], data: list[Sequence]
+    ) -> "ColumnarBatch":
+        if data:
+            return cls(columns, [list(values) for values in zip(*data)])
+        return cls(columns, [[] for _ in columns])
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    def iter_rows(self) -> Iterator[tuple]:
+        return zip(*self.data)
+
+    def to_values(self) -> list[tuple]:
+        return list(self.iter_rows())
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ColumnarBatch):
+            return NotImplemented
+        return self.columns == other.columns and self.data == other.data
+
+    def __repr__(self) -> str:
+        return f"ColumnarBatch(columns={self.columns}, num_rows={self.num_rows})"
+
+
 class ExportContext(pydantic.BaseModel):
     columns: Union[list, tuple, set]
-    data: list
+    # Chunk of data: list or ColumnarBatch.
+    # The payload is passed as is, the values are checked by the transformation.
+    data: Any = ...
     data_orient: DataOrient.LiteralT
     request_kwargs: dict = pydantic.Field(default_factory=dict)
     response_kwargs: dict = pydantic.Field(default_factory=dict)
@@ -36,5 +88,6 @@ class TransformContext(pydantic.BaseModel):
     size: int
     insert_columns: Union[list, tuple, set]
     partitions: Union[list, tuple, set]
-    data: list
-    data_errors: list
+    # The payload is passed as is, like ExportContext.data.
+    data: Any = ...
+    data_errors: Any = ...
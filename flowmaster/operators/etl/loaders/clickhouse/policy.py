@@ -1,6 +1,6 @@
 from typing import Union, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PositiveInt
 
 from flowmaster.operators.base.policy import BasePolicy
 from flowmaster.operators.etl.transform.policy import (
@@ -26,6 +26,13 @@ class ClickhouseLoadPolicy(BasePolicy):
     credentials: CredentialsPolicy
     table_schema: TableSchemaPolicy
     data_cleaning_mode: Literal["partition", "off", "truncate"]
+    insert_mode: Literal["checked", "native"] = "checked"
+    # Compression of the inserted data, needs the package clickhouse-driver[lz4]
+    # or clickhouse-driver[zstd].
+    compression: Union[bool, Literal["lz4", "lz4hc", "zstd"]] = False
+    # Number of inserts into the staging table running at the same time.
+    insert_parallelism: PositiveInt = 1
+    publish_mode: Literal["copy", "replace_partition"] = "copy"
     sql_after: Optional[list[str]] = Field(default_factory=list)
     sql_before: Optional[list[str]] = Field(default_factory=list)
     concurrency: int = 2
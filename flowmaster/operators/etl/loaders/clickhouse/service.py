@@ -1,4 +1,7 @@
 import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import TYPE_CHECKING, Optional
 
 from flowmaster.operators.etl.enums import DataOrient
@@ -11,6 +14,11 @@ from flowmaster.utils.logging_helper import Logger, getLogger
 if TYPE_CHECKING:
     from flowmaster.operators.etl.policy import ETLNotebook
     from flowmaster.operators.etl.dataschema import TransformContext, ETLContext
+    import clickhousepy
+
+
+# {(db, table, notebook hash): time.monotonic() of the table validation}
+_validated_tables: dict[tuple[str, str, str], float] = {}
 
 
 class ClickhouseLoader:
@@ -21,29 +29,69 @@ class ClickhouseLoader:
         off = "off"
         partition = "partition"
 
+    class InsertMode:
+        """
+        checked: clickhouse-driver checks the type of each value before sending.
+        native: the columns are written to Native blocks without checking values,
+        the transformation has already cast them to the types of the table.
+        """
+
+        checked = "checked"
+        native = "native"
+
+    class PublishMode:
+        """
+        Transfer of data from the staging table to the target table.
+        copy: clears stale data, then copies the rows with INSERT SELECT.
+        replace_partition: swaps the partitions of the staging table into the target
+        table without rewriting the data, each partition is replaced atomically.
+        """
+
+        copy = "copy"
+        replace_partition = "replace_partition"
+
     name = "clickhouse"
     policy_model = ClickhouseLoadPolicy
     transform_policy_model = ClickhouseTransformPolicy
     data_orient = DataOrient.columns
+    # Seconds during which the runs of the same notebook version in the process
+    # do not check and change the schema of the table again.
+    table_cache_ttl = 60 * 60
 
     def __init__(self, notebook: "ETLNotebook", logger: Optional[Logger] = None):
-        import clickhousepy
-
         self.data_cleaning_mode = notebook.load.data_cleaning_mode
         self.credentials = notebook.load.credentials.dict()
         self.create_table_config = notebook.load.table_schema.dict()
         self.sql_after = notebook.load.sql_after
         self.sql_before = notebook.load.sql_before
+        self.insert_mode = notebook.load.insert_mode
+        self.compression = notebook.load.compression
+        self.insert_parallelism = notebook.load.insert_parallelism
+        self.publish_mode = notebook.load.publish_mode
+        self.notebook_hash = notebook.hash
 
-        self.client = clickhousepy.Client(**self.credentials)
+        self.client = self.create_client()
         self.DB = self.client.DB(self.create_table_config["db"])
         self.Table = self.client.Table(
             self.create_table_config["db"], self.create_table_config["table"]
         )
         self.StageTable: Optional[clickhousepy.Table] = None
         self.partitions = []
+        self.inserted_rows = 0
         self.logger = logger or getLogger()
 
+        # Background inserts, each thread has its own connection.
+        self._insert_executor: Optional[ThreadPoolExecutor] = None
+        self._insert_futures: list[Future] = []
+        self._insert_clients: list["clickhousepy.Client"] = []
+        self._thread_data = threading.local()
+        self._lock = threading.Lock()
+
+    def create_client(self) -> "clickhousepy.Client":
+        import clickhousepy
+
+        return clickhousepy.Client(**self.credentials, compression=self.compression)
+
     def update_context(self, model: "ETLContext") -> None:
         model.db = self.Table.db
         model.table = self.Table.table
@@ -94,6 +142,40 @@ class ClickhouseLoader:
         self.client.create_table_mergetree(**create_table_config)
         self.add_columns()
 
+    @property
+    def _table_cache_key(self) -> tuple[str, str, str]:
+        return self.Table.db, self.Table.table, self.notebook_hash
+
+    def is_table_validated(self) -> bool:
+        validated_time = _validated_tables.get(self._table_cache_key)
+        return (
+            validated_time is not None
+            and time.monotonic() - validated_time < self.table_cache_ttl
+        )
+
+    def create_stage_table(self) -> "clickhousepy.Table":
+        from clickhouse_driver.errors import ServerException
+
+        stage_table_name = "{}_{}".format(
+            self.create_table_config["table"], random.getrandbits(32)
+        )
+        is_validated = self.is_table_validated()
+        if not is_validated:
+            self.create_table(self.create_table_config)
+            _validated_tables[self._table_cache_key] = time.monotonic()
+
+        try:
+            return self.Table.copy_table(
+                self.Table.db, stage_table_name, return_new_table=True
+            )
+        except ServerException:
+            if not is_validated:
+                raise
+
+            # The table has been changed since the validation, for example dropped.
+            _validated_tables.pop(self._table_cache_key, None)
+            return self.create_stage_table()
+
     def clear_stale_data(self) -> None:
         if self.data_cleaning_mode == self.DataCleaningMode.truncate:
             self.logger.info("Truncate table")
@@ -111,6 +193,51 @@ class ClickhouseLoader:
         else:
             raise KeyError(f"'Unknown {self.data_cleaning_mode=}'")
 
+    def get_partition_ids(self, table: "clickhousepy.Table") -> list[str]:
+        query = (
+            "SELECT DISTINCT partition_id FROM system.parts "
+            "WHERE database = %(db)s AND table = %(table)s AND active"
+        )
+        rows = self.client.execute(query, {"db": table.db, "table": table.table})
+        return sorted(row[0] for row in rows)
+
+    def replace_partitions(self) -> None:
+        stage_partition_ids = self.get_partition_ids(self.StageTable)
+        stale_partition_ids = []
+        if self.data_cleaning_mode == self.DataCleaningMode.truncate:
+            stale_partition_ids = [
+                partition_id
+                for partition_id in self.get_partition_ids(self.Table)
+                if partition_id not in stage_partition_ids
+            ]
+        elif self.data_cleaning_mode not in (
+            self.DataCleaningMode.partition,
+            self.DataCleaningMode.off,
+        ):
+            raise KeyError(f"'Unknown {self.data_cleaning_mode=}'")
+
+        # Data is appended with the off mode, otherwise the partition is replaced.
+        command = (
+            "ATTACH"
+            if self.data_cleaning_mode == self.DataCleaningMode.off
+            else "REPLACE"
+        )
+        self.logger.info("{} partitions: {}", command.title(), stage_partition_ids)
+        for partition_id in stage_partition_ids:
+            self.client.execute(
+                f"ALTER TABLE {self.Table} {command} PARTITION ID '{partition_id}' "
+                f"FROM {self.StageTable}"
+            )
+
+        if stale_partition_ids:
+            self.logger.info("Drop partitions: {}", stale_partition_ids)
+        for partition_id in stale_partition_ids:
+            self.client.execute(
+                f"ALTER TABLE {self.Table} DROP PARTITION ID '{partition_id}'"
+            )
+
+        self.partitions.clear()
+
     def __call__(self, context: "TransformContext", *args, **kwargs) -> None:
         self.validate_insert_columns(context.insert_columns)
 
@@ -119,33 +246,94 @@ class ClickhouseLoader:
 
         if context.data:
             self.partitions += context.partitions
-
-            rows = len(context.data[0])
-            rows_before = self.StageTable.get_count_rows()
             self.logger.info(
                 "Iteration of inserting data into a staging table '{}.{}'",
                 self.StageTable.db,
                 self.StageTable.table,
             )
-            self.StageTable.insert(
-                context.data, context.insert_columns, types_check=True, columnar=True
-            )
-            rows_after = self.StageTable.get_count_rows()
-
-            if not rows_after - rows_before == rows:
-                raise AssertionError("Different number of rows after inserting")
+            if self.insert_parallelism > 1:
+                self.submit_insert(context)
+            else:
+                self.insert(self.client, context)
         else:
             self.logger.info("No data to insert")
 
-    def __enter__(self) -> "ClickhouseLoader":
-        stage_table_name = "{}_{}".format(
-            self.create_table_config["table"], random.getrandbits(32)
+    def insert(
+        self, client: "clickhousepy.Client", context: "TransformContext"
+    ) -> None:
+        rows = context.data.num_rows
+        inserted_rows = client.insert(
+            self.StageTable.db,
+            self.StageTable.table,
+            context.data.data,
+            context.insert_columns,
+            types_check=self.insert_mode == self.InsertMode.checked,
+            columnar=True,
         )
-        self.create_table(self.create_table_config)
-        self.StageTable = self.Table.copy_table(
-            self.Table.db, stage_table_name, return_new_table=True
+        if inserted_rows != rows:
+            raise AssertionError(
+                "Different number of rows after inserting "
+                f"({inserted_rows=} != {rows=})"
+            )
+
+        with self._lock:
+            self.inserted_rows += inserted_rows
+
+    def _insert_in_thread(self, context: "TransformContext") -> None:
+        client = getattr(self._thread_data, "client", None)
+        if client is None:
+            client = self._thread_data.client = self.create_client()
+            with self._lock:
+                self._insert_clients.append(client)
+
+        self.insert(client, context)
+
+    def submit_insert(self, context: "TransformContext") -> None:
+        """
+        Inserts in the background, no more than insert_parallelism at a time.
+        Waits for a free thread, so that the chunks do not accumulate in memory.
+        """
+        if self._insert_executor is None:
+            self._insert_executor = ThreadPoolExecutor(
+                self.insert_parallelism, thread_name_prefix="clickhouse_insert"
+            )
+
+        pending = [f for f in self._insert_futures if not f.done()]
+        while len(pending) >= self.insert_parallelism:
+            _, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        # The failed insert stops the load before exporting the remaining chunks.
+        for future in self._insert_futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+        self._insert_futures = [f for f in self._insert_futures if not f.done()]
+        self._insert_futures.append(
+            self._insert_executor.submit(self._insert_in_thread, context)
         )
 
+    def wait_inserts(self) -> Optional[BaseException]:
+        """Waits for the background inserts, returns the error of the first failed."""
+        wait(self._insert_futures)
+        errors = [
+            f.exception() for f in self._insert_futures if f.exception() is not None
+        ]
+        self._insert_futures.clear()
+
+        if self._insert_executor is not None:
+            self._insert_executor.shutdown()
+            self._insert_executor = None
+            self._thread_data = threading.local()
+        for client in self._insert_clients:
+            client.disconnect()
+        self._insert_clients.clear()
+
+        return errors[0] if errors else None
+
+    def __enter__(self) -> "ClickhouseLoader":
+        self.StageTable = self.create_stage_table()
+        self.inserted_rows = 0
+
         for sql in self.sql_before:
             self.client.execute(sql)
 
@@ -154,16 +342,32 @@ class ClickhouseLoader:
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         is_identic = True
         try:
+            # The staging table is dropped only after all inserts into it have finished.
+            insert_error = self.wait_inserts()
             if not exc_val:
-                self.logger.info("Clear stale data")
-                self.clear_stale_data()
-                self.logger.info(
-                    "Transferring data from a staging table "
-                    f"'{self.StageTable.db}.{self.StageTable.table}'"
-                )
-                is_identic = self.Table.copy_data_from(
-                    self.StageTable.db, self.StageTable.table
-                )
+                if insert_error is not None:
+                    raise insert_error
+
+                # One check of all inserts instead of counting the rows around each one.
+                rows = self.StageTable.get_count_rows()
+                if rows != self.inserted_rows:
+                    raise AssertionError(
+                        "Different number of rows in the staging table "
+                        f"({rows=} != {self.inserted_rows=})"
+                    )
+
+                if self.publish_mode == self.PublishMode.replace_partition:
+                    self.replace_partitions()
+                else:
+                    self.logger.info("Clear stale data")
+                    self.clear_stale_data()
+                    self.logger.info(
+                        "Transferring data from a staging table "
+                        f"'{self.StageTable.db}.{self.StageTable.table}'"
+                    )
+                    is_identic = self.Table.copy_data_from(
+                        self.StageTable.db, self.StageTable.table
+                    )
 
         finally:
             self.StageTable.drop_table()
@@ -1,6 +1,6 @@
 import pathlib
 from functools import partial
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Iterable, Optional, Sequence
 
 import jinja2
 import orjson
@@ -23,7 +23,7 @@ class CSVLoader:
     name = "csv"
     policy_model = CSVLoadPolicy
     transform_policy_model = CSVTransformPolicy
-    data_orient = DataOrient.values
+    data_orient = DataOrient.columns
 
     def __init__(self, notebook: "ETLNotebook", logger: Optional[Logger] = None):
         self.notebook = notebook
@@ -60,7 +60,7 @@ class CSVLoader:
     def update_context(self, model: "ETLContext") -> None:
         model.path = str(self.file_path)
 
-    def values_to_text(self, data: list) -> str:
+    def values_to_text(self, data: Iterable[Sequence]) -> str:
         func_dump_value = lambda value: orjson.dumps(value, custom_encoder).decode()
         func_row_to_line = lambda row: self.sep.join(map(func_dump_value, row))
         data = self.newline.join(map(func_row_to_line, data))
@@ -93,7 +93,7 @@ class CSVLoader:
 
         self.columns = context.insert_columns
 
-        text = self.values_to_text(context.data)
+        text = self.values_to_text(context.data.iter_rows())
 
         # Add column names.
         if (
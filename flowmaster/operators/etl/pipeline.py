@@ -0,0 +1,174 @@
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+from flowmaster.executors import NextIterationInPools
+
+_STOP = object()
+
+
+class ETLPipeline:
+    """
+    Transform and load steps in their own threads, connected by bounded queues.
+    While chunk N is loaded, chunk N+1 is transformed and chunk N+2 is exported,
+    so the duration of the flow approaches the duration of the slowest step.
+    Each step takes a slot in its own pools for each chunk.
+    """
+
+    # How often the waiting in the queues checks that the pipeline has stopped.
+    poll_interval = 0.1
+
+    def __init__(
+        self,
+        transform: Callable[[Any], Any],
+        load: Callable[[Any], None],
+        *,
+        transform_pool_names: Optional[list[str]] = None,
+        load_pool_names: Optional[list[str]] = None,
+        maxsize: int = 1,
+        name: str = "",
+    ):
+        self.transform_queue = queue.Queue(maxsize)
+        self.load_queue = queue.Queue(maxsize)
+        self.stop_event = threading.Event()
+        self.error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+        self._is_finished = False
+        self.threads = [
+            threading.Thread(
+                target=self._step,
+                args=(transform, transform_pool_names, self.transform_queue),
+                kwargs={"output_queue": self.load_queue},
+                name=f"{name}_transform",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._step,
+                args=(load, load_pool_names, self.load_queue),
+                name=f"{name}_load",
+                daemon=True,
+            ),
+        ]
+
+    def _put(self, queue_: queue.Queue, item: Any) -> bool:
+        while not self.stop_event.is_set():
+            try:
+                queue_.put(item, timeout=self.poll_interval)
+            except queue.Full:
+                continue
+            else:
+                return True
+
+        return False
+
+    def _get(self, queue_: queue.Queue) -> Any:
+        while not self.stop_event.is_set():
+            try:
+                return queue_.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+
+        return _STOP
+
+    def _step(
+        self,
+        func: Callable[[Any], Any],
+        pool_names: Optional[list[str]],
+        input_queue: queue.Queue,
+        *,
+        output_queue: Optional[queue.Queue] = None,
+    ) -> None:
+        try:
+            while True:
+                item = self._get(input_queue)
+                if item is _STOP:
+                    break
+
+                pool = NextIterationInPools(pool_names=pool_names or [])
+                if not pool.wait(self.stop_event):
+                    break
+                try:
+                    result = func(item)
+                finally:
+                    pool.done()
+
+                if output_queue is not None and not self._put(output_queue, result):
+                    break
+
+        except BaseException as exc:
+            with self._error_lock:
+                if self.error is None:
+                    self.error = exc
+            self.stop_event.set()
+
+        else:
+            if output_queue is not None:
+                self._put(output_queue, _STOP)
+
+    def start(self) -> None:
+        for thread in self.threads:
+            thread.start()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def put(self, item: Any) -> None:
+        """
+        Passes the exported chunk to the transform step, waits while the queue is full.
+        Raises the error of the step if the pipeline has stopped.
+        """
+        if not self._put(self.transform_queue, item):
+            self._raise_error()
+
+    def put_nowait(self, item: Any) -> bool:
+        """
+        Passes the exported chunk to the transform step without waiting,
+        returns False if the queue is full.
+        Raises the error of the step if the pipeline has stopped.
+        """
+        if self.stop_event.is_set():
+            self._raise_error()
+            return True
+
+        try:
+            self.transform_queue.put_nowait(item)
+        except queue.Full:
+            return False
+        return True
+
+    def finish_nowait(self) -> bool:
+        """
+        Signals the end of the chunks without waiting,
+        returns True when all steps have finished. The errors are raised by join.
+        """
+        if not self._is_finished:
+            self._is_finished = self.put_nowait(_STOP)
+
+        return self._is_finished and not any(
+            thread.is_alive() for thread in self.threads
+        )
+
+    def join(self) -> None:
+        """Waits until all chunks are loaded, raises the first error of the steps."""
+        if not self._is_finished:
+            self._is_finished = True
+            self._put(self.transform_queue, _STOP)
+        for thread in self.threads:
+            thread.join()
+
+        self._raise_error()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+
+    def __enter__(self) -> "ETLPipeline":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is not None:
+            # The remaining chunks are not loaded.
+            self.stop()
@@ -11,6 +11,8 @@ from flowmaster.operators.etl.providers import Providers
 class ETLNotebook(BaseNotebook):
     class WorkPolicy(BaseNotebook.WorkPolicy):
         update_stale_data: Optional[Union[PositiveInt, list[NegativeInt]]] = None
+        # Export, transform and load of the chunks overlap, each step in its own thread.
+        pipeline: bool = False
 
     provider: str
     storage: str
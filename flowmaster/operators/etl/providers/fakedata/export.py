@@ -2,10 +2,9 @@ from typing import TYPE_CHECKING, Optional, Iterator
 
 from faker import Faker
 
-from flowmaster.operators.etl.dataschema import ExportContext
+from flowmaster.operators.etl.dataschema import ColumnarBatch, ExportContext
 from flowmaster.operators.etl.enums import DataOrient
 from flowmaster.operators.etl.providers.abstract import ExportAbstract
-from flowmaster.utils import chunker
 from flowmaster.utils.logging_helper import Logger
 
 fake = Faker()
@@ -25,12 +24,15 @@ class FakeDataExport(ExportAbstract):
         self.logger.info("Exportation data")
 
         fake_data = [
-            [getattr(fake, col)() for col in self.columns] for _ in range(self.rows)
+            [getattr(fake, col)() for _ in range(self.rows)] for col in self.columns
         ]
 
-        for data in chunker(fake_data, (int(self.rows / 5) or 1)):
+        chunk_size = int(self.rows / 5) or 1
+        for i in range(0, self.rows, chunk_size):
             yield ExportContext(
                 columns=self.columns,
-                data=data,
-                data_orient=DataOrient.values,
+                data=ColumnarBatch(
+                    self.columns, [values[i : i + chunk_size] for values in fake_data]
+                ),
+                data_orient=DataOrient.columns,
             )
@@ -3,6 +3,7 @@ from typing import TYPE_CHECKING, Iterator
 import peewee
 import pendulum
 
+from flowmaster.database import read_db
 from flowmaster.models import FlowItem
 from flowmaster.operators.etl.dataschema import ExportContext
 from flowmaster.operators.etl.enums import DataOrient
@@ -22,11 +23,12 @@ class FlowmasterDataExport(ExportAbstract):
     def resource_items(
         self, start_period, end_period, **kwargs
     ) -> Iterator[ExportContext]:
-        query: peewee.ModelSelect = FlowItem.select()
+        query: peewee.ModelSelect = FlowItem.select().bind(read_db)
 
         if self.export.export_mode == "by_date":
             query = query.where(
-                FlowItem.worktime >= start_period, FlowItem.worktime <= end_period
+                FlowItem.worktime_ts >= start_period,
+                FlowItem.worktime_ts <= end_period,
             )
 
         yield ExportContext(
@@ -45,20 +47,16 @@ class FlowmasterDataExport(ExportAbstract):
         )
 
     def resource_queues(self) -> Iterator[ExportContext]:
-        from flowmaster.executors import sleeptask_queue
-        from flowmaster.executors import task_queue
+        from flowmaster.executors import running_executors
+
+        sizes = {"tasks": 0, "sleeptasks": 0}
+        for executor in list(running_executors):
+            for name, size in executor.queue_sizes().items():
+                sizes[name] += size
 
         data = [
-            {
-                "name": "tasks",
-                "size": task_queue.qsize(),
-                "datetime": pendulum.now("local"),
-            },
-            {
-                "name": "sleeptasks",
-                "size": sleeptask_queue.qsize(),
-                "datetime": pendulum.now("local"),
-            },
+            {"name": name, "size": size, "datetime": pendulum.now("local")}
+            for name, size in sizes.items()
         ]
 
         yield ExportContext(
@@ -12,6 +12,7 @@ class FlowmasterDataExportPolicy(BasePolicy):
             Literal[
                 "name",
                 "worktime",
+                "worktime_ts",
                 "status",
                 "data",
                 "notebook_hash",
@@ -22,6 +23,8 @@ class FlowmasterDataExportPolicy(BasePolicy):
                 "finished_utc",
                 "created_utc",
                 "updated_utc",
+                "lease_owner",
+                "lease_expires_utc",
             ],
             # pools
             Literal["name", "size", "limit", "datetime"],
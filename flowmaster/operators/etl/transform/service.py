@@ -1,8 +1,10 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import TYPE_CHECKING, Any, Optional
 
 from datagun import DataSet, NULL_VALUES
 
-from flowmaster.operators.etl.dataschema import TransformContext
+from flowmaster.operators.etl.dataschema import ColumnarBatch, TransformContext
 from flowmaster.operators.etl.enums import DataOrient
 from flowmaster.operators.etl.loaders import Loaders
 from flowmaster.operators.etl.transform import TransformSchemas
@@ -32,6 +34,12 @@ class Transform:
         column_schema: list[dict],
         orient: DataOrient.LiteralT,
     ) -> DataSet:
+        if isinstance(data, ColumnarBatch):
+            data, orient = data.data, DataOrient.columns
+        elif not isinstance(data, list):
+            # For example, the tuple of rows of the database cursor.
+            data = list(data)
+
         return DataSet(data, schema=column_schema, orient=orient)
 
     def changing_data_orient_for_storage(self, dataset):
@@ -40,7 +48,7 @@ class Transform:
         if Loader.data_orient == DataOrient.values:
             data = dataset.to_values()
         elif Loader.data_orient == DataOrient.columns:
-            data = dataset.to_list()
+            data = ColumnarBatch(dataset.columns, dataset.to_list())
         elif Loader.data_orient == DataOrient.dict:
             data = dataset.to_dict()
         else:
@@ -76,3 +84,40 @@ class Transform:
             data=data,
             data_errors=dataset.get_errors().to_values(),
         )
+
+
+_process_transforms: dict[str, Transform] = {}
+
+
+def create_transform_executor(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Pool of processes for the transform step.
+    The processes are spawned, since forking a process with the running threads
+    of the executor, the database and the web server can deadlock on their locks.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def transform_in_process(
+    notebook: "ETLNotebook", export_context: "ExportContext"
+) -> TransformContext:
+    """
+    Transform step for execution in a process pool.
+    The transformer is created once for each version of the notebook in the process,
+    the result is returned by pickling.
+    """
+    from flowmaster.operators.etl.providers import Providers
+
+    transform = _process_transforms.get(notebook.hash)
+    if transform is None:
+        provider_class = Providers[notebook.provider]
+        transform_class = provider_class.transform_class
+        if transform_class == NotImplemented:
+            transform_class = Transform
+
+        transform = transform_class(notebook)
+        _process_transforms[notebook.hash] = transform
+
+    return transform(export_context)
@@ -1,13 +1,23 @@
+import datetime as dt
+from concurrent.futures import Executor
 from typing import TYPE_CHECKING, Iterator, Optional
 
 from flowmaster.executors import catch_exceptions, ExecutorIterationTask
 from flowmaster.models import FlowItem
-from flowmaster.operators.base.work import Work, prepare_items_for_order
-from flowmaster.service import iter_active_notebook_filenames, get_notebook
+from flowmaster.operators.base.work import (
+    Work,
+    flow_due_index,
+    prepare_items_for_order,
+)
+from flowmaster.service import notebook_registry
 from flowmaster.utils.logging_helper import Logger, getLogger
 from flowmaster.utils.logging_helper import logger
 
+ORDERING_LEASE_KEY = "etl_ordering"
+ETL_TASK_QUEUE = "etl_tasks"
+
 if TYPE_CHECKING:
+    from flowmaster.broker import BaseBroker
     from flowmaster.operators.etl.core import ETLOperator
     from flowmaster.operators.etl.policy import ETLNotebook
 
@@ -41,18 +51,17 @@ class ETLWork(Work):
         )
 
 
-@catch_exceptions
-def ordering_etl_flow_tasks(
-    *, dry_run: bool = False
-) -> Iterator[ExecutorIterationTask]:
-    """Prepare flow function to be sent to the queue and executed"""
-    # TODO: избавиться от функции, переделать так, чтобы одна функция была для заказа
-
+def iter_etl_flows_for_order(
+    *,
+    dry_run: bool = False,
+    transform_executor: Optional[Executor] = None,
+    owner: Optional[str] = None,
+) -> Iterator[tuple["ETLOperator", dt.datetime, dt.datetime]]:
     from flowmaster.operators.etl.core import ETLOperator
     from flowmaster.operators.etl.policy import ETLNotebook
 
-    for name in iter_active_notebook_filenames():
-        validate, text, notebook_dict, notebook, error = get_notebook(name)
+    for name, result in notebook_registry.iter_active_notebooks():
+        validate, text, notebook_dict, notebook, error = result
         notebook: ETLNotebook
         if dry_run:
             if notebook.provider != "fakedata":
@@ -62,13 +71,101 @@ def ordering_etl_flow_tasks(
             logger.error("ValidationError: '{}': {}", name, error)
             continue
 
+        if not flow_due_index.is_due(notebook):
+            continue
+
         work = Work(notebook)
+        flow_due_index.update(work)
         for start_period, end_period in work.iter_period_for_execute():
-            flow = ETLOperator(notebook)
-            etl_flow_task = flow.task(start_period, end_period, dry_run=dry_run)
+            flow = ETLOperator(notebook, transform_executor=transform_executor)
+
+            with prepare_items_for_order(
+                flow, start_period, end_period, owner=owner
+            ) as claimed:
+                if not claimed:
+                    # Already taken by another executor process.
+                    continue
 
-            with prepare_items_for_order(flow, start_period, end_period):
                 logger.info(
                     "Order ETL flow [{}]: {} {}", notebook.name, start_period, end_period
                 )
-                yield etl_flow_task
+                yield flow, start_period, end_period
+
+
+@catch_exceptions
+def ordering_etl_flow_tasks(
+    *, dry_run: bool = False, transform_executor: Optional[Executor] = None
+) -> Iterator[ExecutorIterationTask]:
+    """Prepare flow function to be sent to the queue and executed"""
+    # TODO: избавиться от функции, переделать так, чтобы одна функция была для заказа
+    for flow, start_period, end_period in iter_etl_flows_for_order(
+        dry_run=dry_run, transform_executor=transform_executor
+    ):
+        yield flow.task(start_period, end_period, dry_run=dry_run)
+
+
+@catch_exceptions
+def ordering_etl_flow_tasks_through_broker(
+    *,
+    broker: "BaseBroker",
+    dry_run: bool = False,
+    transform_executor: Optional[Executor] = None,
+    batch_size: Optional[int] = None,
+) -> Iterator[ExecutorIterationTask]:
+    """
+    Tasks are ordered by only one node, the one that holds the lease,
+    and are put in the shared queue of the broker.
+    Each node takes no more than batch_size tasks from the queue
+    and takes over the lease of their items from the ordering node.
+    """
+    from flowmaster.operators.etl.core import ETLOperator
+
+    if broker.lease(ORDERING_LEASE_KEY):
+        messages = [
+            {
+                "name": flow.notebook.name,
+                "start_period": FlowItem.worktime.db_value(start_period),
+                "end_period": FlowItem.worktime.db_value(end_period),
+                "owner": broker.node_id,
+            }
+            for flow, start_period, end_period in iter_etl_flows_for_order(
+                dry_run=dry_run, owner=broker.node_id
+            )
+        ]
+        if messages:
+            broker.push(ETL_TASK_QUEUE, messages)
+
+    for message in broker.pop(ETL_TASK_QUEUE, batch_size):
+        validate, text, notebook_dict, notebook, error = notebook_registry.get(
+            message["name"]
+        )
+        if not validate:
+            logger.error("ValidationError: '{}': {}", message["name"], error)
+            continue
+
+        start_period = FlowItem.worktime.python_value(message["start_period"])
+        end_period = FlowItem.worktime.python_value(message["end_period"])
+        if not FlowItem.take_over_lease(
+            notebook.name,
+            from_time=start_period,
+            to_time=end_period,
+            from_owner=message["owner"],
+            owner=broker.node_id,
+        ):
+            # The lease of the ordering node has expired, the items were claimed again.
+            logger.warning(
+                "Items of ETL flow [{}] {} {} are claimed by another node",
+                notebook.name,
+                start_period,
+                end_period,
+            )
+            continue
+
+        flow = ETLOperator(notebook, transform_executor=transform_executor)
+        logger.info(
+            "Received ETL flow from broker [{}]: {} {}",
+            notebook.name,
+            start_period,
+            end_period,
+        )
+        yield flow.task(start_period, end_period, dry_run=dry_run)
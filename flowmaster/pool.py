@@ -1,5 +1,6 @@
+import threading
 from collections import defaultdict
-from typing import Literal
+from typing import Iterable, Literal, Optional, Protocol, TYPE_CHECKING
 
 import pendulum
 
@@ -7,6 +8,9 @@ from flowmaster.setttings import Settings
 from flowmaster.utils.logging_helper import logger
 from flowmaster.utils.yaml_helper import YamlHelper
 
+if TYPE_CHECKING:
+    from flowmaster.broker import BaseBroker
+
 
 class Counter:
     def __init__(self):
@@ -27,34 +31,167 @@ class Counter:
         return self.counters[item]
 
 
+class PoolWaiterT(Protocol):
+    def wake(self) -> None:
+        ...
+
+
 class Pool:
-    def __init__(self, pools: dict[str, int]):
+    """
+    Limits the number of simultaneously executed iterations.
+    Those who did not get a slot are put in the FIFO wait list of the pool,
+    when the slot is released, the next waiting one in the list is woken up.
+    With a broker, the slots are counted together with the other nodes.
+    """
+
+    def __init__(self, pools: dict[str, int], broker: Optional["BaseBroker"] = None):
         self.limits = {}
         self.sizes = {}
+        # Ordered wait lists. The waiters are held strongly, a parked task
+        # may be referenced only from here. They leave the lists on acquire,
+        # when the task is cancelled or by remove_waiter.
+        self.waiters: dict[str, dict[PoolWaiterT, None]] = defaultdict(dict)
+        self._lock = threading.RLock()
+        self.broker = broker
         self.append_pools(pools)
 
-    def append_pools(self, pools: dict[str, int]) -> None:
-        for tag, limit in pools.items():
-            tag = self._get_uniq_tagname(tag)
-            self.limits[tag] = limit
-            self.sizes[tag] = Counter()
+    def set_broker(self, broker: Optional["BaseBroker"]) -> None:
+        with self._lock:
+            self.broker = broker
 
-    def update_pools(self, pools: dict[str, int]) -> None:
-        for tag, limit in pools.items():
-            self.limits[tag] = limit
-            if tag not in self.sizes:
+    def append_pools(self, pools: dict[str, int]) -> None:
+        with self._lock:
+            for tag, limit in pools.items():
+                tag = self._get_uniq_tagname(tag)
+                self.limits[tag] = limit
                 self.sizes[tag] = Counter()
 
-    def allow(self, tags: list[str]) -> bool:
+    def update_pools(self, pools: dict[str, int]) -> None:
+        with self._lock:
+            for tag, limit in pools.items():
+                self.limits[tag] = limit
+                if tag not in self.sizes:
+                    self.sizes[tag] = Counter()
+
+            self._wake_waiters(list(pools))
+
+    def get_sizes(self, tags: Iterable[str]) -> dict[str, int]:
+        """Occupied slots of the pools, with a broker they are read in one request."""
+        tags = list(tags)
+        if self.broker is not None:
+            return self.broker.slots_of(tags)
+
+        return {tag: self.sizes[tag][tag] for tag in tags}
+
+    def _allow_tag(
+        self, tag: str, size: int, waiter: Optional[PoolWaiterT] = None
+    ) -> bool:
+        free_slots = self.limits[tag] - size
+        waiters = self.waiters[tag]
+        if waiter is not None and waiter in waiters:
+            # Slots are given to the waiting in the order of the queue.
+            return list(waiters).index(waiter) < free_slots
+        return len(waiters) < free_slots
+
+    def allow(self, tags: list[str], waiter: Optional[PoolWaiterT] = None) -> bool:
+        with self._lock:
+            return self._allow(tags, self.get_sizes(tags), waiter)
+
+    def _allow(
+        self,
+        tags: list[str],
+        sizes: dict[str, int],
+        waiter: Optional[PoolWaiterT] = None,
+    ) -> bool:
         results = []
         for tag in tags:
-            is_free = self.sizes[tag][tag] < self.limits[tag]
+            is_free = self._allow_tag(tag, sizes[tag], waiter)
             results.append(is_free)
             if is_free is False:
                 logger.debug("Pool '{}' full", tag)
 
         return all(results)
 
+    def acquire(self, tags: list[str], waiter: PoolWaiterT) -> bool:
+        """
+        Takes a slot in all pools.
+        If there are no free slots, the waiter is put on the wait lists of the full pools
+        and will be woken up when a slot is released.
+        """
+        with self._lock:
+            sizes = self.get_sizes(tags)
+            if self._allow(tags, sizes, waiter):
+                if self._take_slots(tags):
+                    self.remove_waiter(waiter)
+                    return True
+
+                # The slots were taken by another node in the meantime,
+                # waiting until the next refresh.
+                for tag in tags:
+                    self.waiters[tag].setdefault(waiter, None)
+                return False
+
+            left_tags = []
+            for tag in tags:
+                waiters = self.waiters[tag]
+                if self._allow_tag(tag, sizes[tag], waiter):
+                    # The place in the queue is held only in the pools that are full,
+                    # otherwise the waiting could block each other.
+                    if waiter in waiters:
+                        del waiters[waiter]
+                        left_tags.append(tag)
+                elif waiter not in waiters:
+                    waiters[waiter] = None
+
+            self._wake_waiters(left_tags, sizes)
+
+            return False
+
+    def remove_waiter(self, waiter: PoolWaiterT) -> None:
+        with self._lock:
+            left_tags = []
+            for tag, waiters in self.waiters.items():
+                if waiter in waiters:
+                    del waiters[waiter]
+                    left_tags.append(tag)
+
+            self._wake_waiters(left_tags)
+
+    def _take_slots(self, tags: list[str]) -> bool:
+        if self.broker is None:
+            self[tags] = 1
+            return True
+
+        if not self.broker.acquire_slots({tag: self.limits[tag] for tag in tags}):
+            return False
+
+        for tag in tags:
+            self.sizes[tag][tag] = 1
+        return True
+
+    def _wake_waiters(
+        self, tags: list[str], sizes: Optional[dict[str, int]] = None
+    ) -> None:
+        tags = [tag for tag in tags if self.waiters[tag]]
+        if not tags:
+            return
+
+        if sizes is None:
+            sizes = self.get_sizes(tags)
+
+        for tag in tags:
+            free_slots = self.limits[tag] - sizes[tag]
+            for waiter in list(self.waiters[tag])[: max(0, free_slots)]:
+                waiter.wake()
+
+    def refresh(self) -> None:
+        """
+        Wakes up the waiting for which slots are free.
+        Needed with a broker, since the release of slots by other nodes is not notified.
+        """
+        with self._lock:
+            self._wake_waiters(list(self.waiters))
+
     def _get_uniq_tagname(self, tag: str) -> str:
         if tag in self.limits:
             tag += "_"
@@ -62,24 +199,31 @@ class Pool:
         return tag
 
     def __setitem__(self, tags: list[str], switch: Literal[1, -1]) -> None:
-        for tag in tags:
-            counter = self.sizes[tag]
-            counter[tag] = switch
+        with self._lock:
+            if self.broker is not None:
+                self.broker.change_slots(tags, switch)
+
+            for tag in tags:
+                counter = self.sizes[tag]
+                counter[tag] = switch
+
+            if switch == -1:
+                self._wake_waiters(tags)
 
     def __getitem__(self, tag: str) -> int:
-        counter: Counter = self.sizes[tag]
-        return counter[tag]
+        return self.get_sizes([tag])[tag]
 
     def info(self, only_used=True) -> list[dict]:
         data = []
+        sizes = self.get_sizes(self.limits)
         for tag, limit in self.limits.items():
-            if only_used and self[tag] == 0:
+            if only_used and sizes[tag] == 0:
                 continue
 
             data.append(
                 {
                     "name": tag,
-                    "size": self[tag],
+                    "size": sizes[tag],
                     "limit": limit,
                     "datetime": pendulum.now("local"),
                 }
@@ -97,8 +241,9 @@ class Pool:
 
     def __str__(self) -> str:
         text = ""
+        sizes = self.get_sizes(self.limits)
         for tag, limit in self.limits.items():
-            text += f"{tag}: {self[tag]}/{limit}\n"
+            text += f"{tag}: {sizes[tag]}/{limit}\n"
 
         return str(text)
 
@@ -1,9 +1,11 @@
 import contextlib
 import os
 import shutil
+import threading
 from pathlib import Path
 from typing import Iterator, Optional
 
+import pendulum
 import yaml
 from pydantic import ValidationError, BaseModel
 
@@ -109,6 +111,55 @@ def get_notebook(name: str) -> tuple[bool, str, dict, Optional[BaseModel], str]:
         return validate_text, text, notebook_dict, None, error
 
 
+class NotebookRegistry:
+    """
+    Cache of parsed and validated notebooks.
+    The file is read again only when its modification time or size has changed.
+    """
+
+    def __init__(self):
+        self._notebooks: dict[str, tuple[tuple[int, int], tuple]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_signature(name: str) -> Optional[tuple[int, int]]:
+        for dirpath in (Settings.NOTEBOOKS_DIR, Settings.ARCHIVE_NOTEBOOKS_DIR):
+            with contextlib.suppress(FileNotFoundError):
+                stat = os.stat(dirpath / name)
+                return stat.st_mtime_ns, stat.st_size
+
+    def get(self, name: str) -> tuple[bool, str, dict, Optional[BaseModel], str]:
+        signature = self._file_signature(name)
+        if signature is None:
+            with self._lock:
+                self._notebooks.pop(name, None)
+            return get_notebook(name)
+
+        with self._lock:
+            cached = self._notebooks.get(name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        notebook = get_notebook(name)
+        with self._lock:
+            self._notebooks[name] = (signature, notebook)
+
+        return notebook
+
+    def iter_active_notebooks(
+        self,
+    ) -> Iterator[tuple[str, tuple[bool, str, dict, Optional[BaseModel], str]]]:
+        for name in iter_active_notebook_filenames():
+            yield name, self.get(name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._notebooks.clear()
+
+
+notebook_registry = NotebookRegistry()
+
+
 def save_notebook(name: str, text: str, is_archive: bool) -> None:
     if is_archive:
         path = Settings.ARCHIVE_NOTEBOOKS_DIR / name
@@ -129,6 +180,32 @@ def save_new_notebook(name: str, text: str, is_archive: bool) -> Optional[bool]:
     return save_notebook(name, text, is_archive)
 
 
+def compact_items(default_retention_days: Optional[int] = None) -> dict[str, int]:
+    """
+    Moves old successful items of the flows to the archive files.
+    The retention period is taken from the notebook, otherwise the default one is used.
+    Returns the number of archived items by flow names.
+    """
+    counts = {}
+    for item in FlowItem.count_items_by_name():
+        retention_days = default_retention_days
+        with contextlib.suppress(FileNotFoundError):
+            *_, notebook, _ = notebook_registry.get(item.name)
+            if notebook is not None and notebook.work and notebook.work.retention_days:
+                retention_days = notebook.work.retention_days
+
+        if retention_days is None:
+            continue
+
+        counts[item.name] = FlowItem.archive_items(
+            item.name,
+            to_time=pendulum.now("UTC").subtract(days=retention_days),
+            path=Settings.ITEMS_ARCHIVE_DIR / f"{item.name}.jsonl.gz",
+        )
+
+    return counts
+
+
 def delete_notebook(name: str) -> None:
     path = get_filepath_notebook(name)
     if path:
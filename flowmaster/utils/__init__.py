@@ -1,4 +1,6 @@
 import datetime as dt
+import os
+import socket
 from copy import deepcopy
 from itertools import islice
 from typing import Iterable, Any, Optional, TypeVar, Union
@@ -126,4 +128,9 @@ class KlassCollection:
 def custom_encoder(obj):
     if isinstance(obj, (pendulum.Date, pendulum.DateTime)):
         return str(obj)
-    raise TypeError
\ No newline at end of file
+    raise TypeError
+
+
+def get_node_id() -> str:
+    """Identifier of the executor process, unique among several machines."""
+    return f"{socket.gethostname()}:{os.getpid()}"
@@ -1,12 +1,15 @@
 import pathlib
+from collections import defaultdict
 from os.path import abspath
 
 from fastapi import FastAPI, Request, Form
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 
+from flowmaster.database import read_db
 from flowmaster.enums import Statuses
-from flowmaster.models import FlowItem
+from flowmaster.models import FlowItem, FlowStatusCounter
+from flowmaster.operators.base.work import flow_due_index
 from flowmaster.service import (
     get_notebook,
     validate_notebook_policy,
@@ -18,9 +21,9 @@ from flowmaster.service import (
     archive_notebook,
     unarchive_notebook,
     is_archive_notebook,
-    iter_active_notebook_filenames,
     iter_archive_notebook_filenames,
     delete_notebook,
+    notebook_registry,
 )
 from flowmaster.setttings import Settings
 
@@ -33,17 +36,14 @@ templates = Jinja2Templates(
 @webapp.get("/")
 async def notebooks_view(request: Request):
     # TODO: Add pagination
-    count_statuses_map = {
-        (item.name, item.status): item.count
-        for item in FlowItem.count_items_by_name_and_status()
-    }
-    count_names_map = {item.name: item.count for item in FlowItem.count_items_by_name()}
+    count_statuses_map = FlowStatusCounter.counts(read_db)
+    count_names_map = defaultdict(int)
+    for (name, _), count in count_statuses_map.items():
+        count_names_map[name] += count
     notebooks = []
 
-    for name in iter_active_notebook_filenames():
+    for name, (validate, *args) in notebook_registry.iter_active_notebooks():
         data = {"name": name, "is_archive": False}
-        validate, *args = get_notebook(name)
-
         data["count"] = count_names_map.get(name, 0)
         data["count_errors"] = sum(
             count_statuses_map.get((name, status), 0)
@@ -197,7 +197,7 @@ async def tasks_view(name: str, request: Request):
         "/pages/tasks.html",
         context={
             "request": request,
-            "tasks": FlowItem.iter_items(name, limit=1000, offset=0),
+            "tasks": FlowItem.iter_items(name, limit=1000, offset=0).bind(read_db),
         },
     )
 
@@ -211,7 +211,7 @@ async def error_tasks_view(name: str, request: Request):
             "request": request,
             "tasks": FlowItem.iter_items(
                 name, statuses=Statuses.error_statuses, limit=1000, offset=0
-            ),
+            ).bind(read_db),
         },
     )
 
@@ -225,7 +225,7 @@ async def fatal_error_tasks_view(name: str, request: Request):
             "request": request,
             "tasks": FlowItem.iter_items(
                 name, statuses=[Statuses.fatal_error], limit=1000, offset=0
-            ),
+            ).bind(read_db),
         },
     )
 
@@ -234,11 +234,14 @@ async def fatal_error_tasks_view(name: str, request: Request):
 async def log_view(name: str, worktime_for_url: str, request: Request):
     import re
 
-    item: FlowItem = FlowItem.get_or_none(
-        **{
-            FlowItem.name.name: name,
-            FlowItem.worktime.name: FlowItem.worktime_from_url(worktime_for_url),
-        }
+    item: FlowItem = (
+        FlowItem.select()
+        .where(
+            FlowItem.name == name,
+            FlowItem.worktime == FlowItem.worktime_from_url(worktime_for_url),
+        )
+        .bind(read_db)
+        .first()
     )
     if item.logpath:
         if pathlib.Path.exists(pathlib.Path(item.logpath)):
@@ -264,5 +267,6 @@ async def log_view(name: str, worktime_for_url: str, request: Request):
 async def restart_task_view(name: str, worktime_for_url: str):
     worktime = FlowItem.worktime_from_url(worktime_for_url)
     FlowItem.recreate_item(name, worktime)
+    flow_due_index.mark_due(name)
 
     return RedirectResponse(f"/notebook/{name}/tasks")
@@ -18,6 +18,13 @@ def preparation_for_tests(tmp_path):
     create_initial_dirs_and_files()
 
 
+@pytest.fixture(autouse=True)
+def clear_flow_due_index():
+    from flowmaster.operators.base.work import flow_due_index
+
+    flow_due_index.clear()
+
+
 @pytest.fixture()
 def pendulum_utctoday():
     now = pendulum.datetime(2021, 1, 1, tz="UTC")
@@ -247,6 +254,44 @@ def sqlite_to_csv_notebook(
     )
 
 
+@pytest.fixture()
+def csv_to_clickhouse_notebook(work_policy, flowitem_model):
+    from flowmaster.operators.etl.loaders import Loaders
+    from flowmaster.operators.etl.policy import ETLNotebook
+    from flowmaster.operators.etl.providers import Providers
+
+    name = "__test_csv_to_clickhouse__"
+    flowitem_model.clear(name)
+    yield ETLNotebook(
+        name=name,
+        provider=Providers.CSVProvider.name,
+        storage=Loaders.ClickhouseLoader.name,
+        work=work_policy,
+        export=Providers.CSVProvider.policy_model(
+            file_path="", with_columns=False, columns=["date"]
+        ),
+        transform=Loaders.ClickhouseLoader.transform_policy_model(
+            error_policy="default",
+            partition_columns=["Date"],
+            column_map={"date": "Date"},
+        ),
+        load=Loaders.ClickhouseLoader.policy_model(
+            # The client connects on the first query, tests replace the queries.
+            credentials=Loaders.ClickhouseLoader.policy_model.CredentialsPolicy(
+                user="default", host="localhost"
+            ),
+            table_schema=Loaders.ClickhouseLoader.policy_model.TableSchemaPolicy(
+                db="default",
+                table=name,
+                columns=["Date Date"],
+                orders=["Date"],
+                partition=["Date"],
+            ),
+            data_cleaning_mode=Loaders.ClickhouseLoader.DataCleaningMode.partition,
+        ),
+    )
+
+
 @pytest.fixture()
 def flowmasterdata_items_export_policy():
     from flowmaster.operators.etl.providers import Providers
@@ -36,3 +36,216 @@ def test_flow(ya_metrika_logs_to_csv_notebook):
             start_period=dt.datetime(2021, 1, 1), end_period=dt.datetime(2021, 1, 2)
         )
     )
+
+
+def test_flow_transform_in_process(fakedata_to_csv_notebook, monkeypatch):
+    from flowmaster.operators.etl.core import ETLOperator
+    from flowmaster.operators.etl.transform.service import create_transform_executor
+    from flowmaster.setttings import Settings
+
+    # The spawned processes read the settings again, the home must be the same.
+    monkeypatch.setenv("FLOWMASTER_HOME", str(Settings.APP_HOME))
+
+    fakedata_to_csv_notebook.export.rows = 10
+    fakedata_to_csv_notebook.load.with_columns = True
+
+    with create_transform_executor(max_workers=1) as transform_executor:
+        flow = ETLOperator(
+            fakedata_to_csv_notebook, transform_executor=transform_executor
+        )
+        list(
+            flow.task(
+                start_period=dt.datetime(2021, 1, 1), end_period=dt.datetime(2021, 1, 1)
+            )
+        )
+
+    with flow.Load.open_file(mode="r") as loadfile:
+        data = loadfile.readlines()
+
+    assert len(data) == 11
+
+
+def test_flow_coalesces_item_updates(fakedata_to_csv_notebook):
+    from unittest import mock
+
+    from flowmaster.enums import Statuses
+    from flowmaster.models import FlowItem
+    from flowmaster.operators.etl.core import ETLOperator
+
+    fakedata_to_csv_notebook.export.rows = 10
+    flow = ETLOperator(fakedata_to_csv_notebook)
+    flow.items_update_interval = 60
+
+    with mock.patch.object(
+        FlowItem, "bulk_update_items", wraps=FlowItem.bulk_update_items
+    ) as bulk_update_items:
+        list(
+            flow.task(
+                start_period=dt.datetime(2021, 1, 1), end_period=dt.datetime(2021, 1, 2)
+            )
+        )
+
+    # Only the status changes and the final state are written.
+    assert bulk_update_items.call_count == 3
+    assert FlowItem.count_items(
+        fakedata_to_csv_notebook.name, statuses=[Statuses.success]
+    ) == len(flow.items)
+    assert all(
+        i.finished_utc for i in FlowItem.iter_items(fakedata_to_csv_notebook.name)
+    )
+
+
+def test_flow_writes_progress_before_waiting_for_pool(fakedata_to_csv_notebook):
+    import pytest
+
+    from flowmaster.executors import PoolOverflowingException
+    from flowmaster.models import FlowItem
+    from flowmaster.operators.etl.core import ETLOperator
+    from flowmaster.operators.etl.enums import ETLSteps
+    from flowmaster.pool import pools
+
+    pools.append_pools({"__test_flow_progress_pool__": 1})
+    pool_name = list(pools.limits)[-1]
+    fakedata_to_csv_notebook.export.pools = [pool_name]
+    flow = ETLOperator(fakedata_to_csv_notebook)
+    flow.items_update_interval = 60
+    task = flow.task(
+        start_period=dt.datetime(2021, 1, 1), end_period=dt.datetime(2021, 1, 1)
+    )
+
+    pools[[pool_name]] = 1
+    try:
+        with pytest.raises(PoolOverflowingException):
+            next(task)
+    finally:
+        pools[[pool_name]] = -1
+
+    # The export step is written, although the update interval has not passed.
+    (item,) = FlowItem.iter_items(fakedata_to_csv_notebook.name)
+    assert item.data["step"] == ETLSteps.export
+
+    task.execute()
+
+
+def test_flow_pipeline(fakedata_to_csv_notebook):
+    from flowmaster.enums import Statuses
+    from flowmaster.models import FlowItem
+    from flowmaster.operators.etl.core import ETLOperator
+
+    fakedata_to_csv_notebook.work.pipeline = True
+    fakedata_to_csv_notebook.export.rows = 10
+    fakedata_to_csv_notebook.load.with_columns = True
+    flow = ETLOperator(fakedata_to_csv_notebook)
+    list(
+        flow.task(
+            start_period=dt.datetime(2021, 1, 1), end_period=dt.datetime(2021, 1, 1)
+        )
+    )
+
+    with flow.Load.open_file(mode="r") as loadfile:
+        data = loadfile.readlines()
+
+    assert len(data) == 11
+    (item,) = FlowItem.iter_items(fakedata_to_csv_notebook.name)
+    assert item.status == Statuses.success
+    assert item.data["number_rows"] == 10
+
+
+def test_pipeline_overlaps_steps():
+    import time
+
+    from flowmaster.operators.etl.pipeline import ETLPipeline
+
+    loaded = []
+
+    def transform(chunk):
+        time.sleep(0.2)
+        return chunk * 10
+
+    def load(chunk):
+        time.sleep(0.2)
+        loaded.append(chunk)
+
+    begin = time.time()
+    with ETLPipeline(transform, load) as pipeline:
+        for chunk in range(5):
+            # Export step.
+            time.sleep(0.2)
+            pipeline.put(chunk)
+        pipeline.join()
+
+    assert loaded == [0, 10, 20, 30, 40]
+    # Sequentially it would take 3 seconds.
+    assert time.time() - begin < 2
+
+
+def test_pipeline_raises_error_of_step():
+    import pytest
+
+    from flowmaster.operators.etl.pipeline import ETLPipeline
+
+    def load(chunk):
+        if chunk == 1:
+            raise ZeroDivisionError()
+
+    with pytest.raises(ZeroDivisionError):
+        with ETLPipeline(lambda chunk: chunk, load) as pipeline:
+            for chunk in range(100):
+                pipeline.put(chunk)
+            pipeline.join()
+
+    assert all(not thread.is_alive() for thread in pipeline.threads)
+
+
+def test_pipeline_does_not_block_workers(fakedata_to_csv_notebook, flowitem_model):
+    import time
+
+    from flowmaster.executors import (
+        ExecutorIterationTask,
+        NextIterationInPools,
+        ThreadAsyncExecutor,
+    )
+    from flowmaster.operators.etl.core import ETLOperator
+    from flowmaster.pool import pools
+
+    pools.append_pools({"__test_pipeline_does_not_block_workers__": 1})
+    pool_name = list(pools.limits)[-1]
+    completed = []
+
+    def pipeline_flow(number):
+        notebook = fakedata_to_csv_notebook.copy(deep=True)
+        notebook.name = f"{notebook.name}_{number}"
+        notebook.work.pipeline = True
+        notebook.work.pools = [pool_name]
+        notebook.export.rows = 50
+        notebook.load.file_name = f"{number}_{notebook.load.file_name}"
+        flowitem_model.clear(notebook.name)
+        yield from ETLOperator(notebook)._iterator(
+            start_period=dt.datetime(2021, 1, 1), end_period=dt.datetime(2021, 1, 1)
+        )
+        completed.append(number)
+
+    def ordinary_flow():
+        for _ in range(5):
+            yield NextIterationInPools(pool_names=[pool_name])
+            time.sleep(0.01)
+            yield
+        completed.append("ordinary")
+
+    def ordering_task():
+        yield ExecutorIterationTask(pipeline_flow(1))
+        yield ExecutorIterationTask(pipeline_flow(2))
+        yield ExecutorIterationTask(ordinary_flow())
+
+    # The pipeline steps wait for the slot behind the ordinary flow,
+    # which needs a worker, while both workers are executing the pipeline flows.
+    executor = ThreadAsyncExecutor(ordering_task_func=ordering_task, dry_run=True)
+    executor.start(workers=2, orders=1)
+    for _ in range(100):
+        if len(completed) == 3:
+            break
+        time.sleep(0.1)
+    executor.stop()
+
+    assert sorted(completed, key=str) == [1, 2, "ordinary"]
+    assert pools[pool_name] == 0
@@ -339,7 +339,7 @@ def test_items_for_execute_seconds_interval_without_keep_sequence(flowitem_model
     FlowItem.create_items(
         flowitem_model.name_for_test,
         worktime_list=[worktime - dt.timedelta(minutes=4)],
-        **{flowitem_model.status.name: Statuses.success}
+        **{flowitem_model.status.name: Statuses.success},
     )
 
     items = FlowItem.get_items_for_execute(
@@ -373,3 +373,271 @@ def test_items_for_execute_seconds_interval_with_keep_sequence(flowitem_model):
     )
 
     assert len(items) == 10
+
+
+def test_items_for_execute_fills_gaps_and_retries(flowitem_model):
+    worktime = pendulum.datetime(2020, 1, 1, tz="Europe/Moscow")
+    interval_timedelta = dt.timedelta(minutes=1)
+    kwargs = dict(
+        flow_name=flowitem_model.name_for_test,
+        worktime=worktime,
+        start_time=worktime - dt.timedelta(minutes=9),
+        interval_timedelta=interval_timedelta,
+        keep_sequence=True,
+        retries=1,
+        retry_delay=0,
+        notebook_hash="",
+        max_fatal_errors=3,
+    )
+    FlowItem.create_items(
+        flowitem_model.name_for_test,
+        worktime_list=[worktime - interval_timedelta * i for i in range(10)],
+        **{flowitem_model.status.name: Statuses.success},
+    )
+    assert FlowItem.get_items_for_execute(**kwargs) == []
+
+    FlowItem.clear(
+        flowitem_model.name_for_test,
+        from_time=worktime - interval_timedelta * 5,
+        to_time=worktime - interval_timedelta * 4,
+    )
+    FlowItem.change_status(
+        flowitem_model.name_for_test,
+        Statuses.error,
+        from_time=worktime,
+        to_time=worktime,
+    )
+    items = FlowItem.get_items_for_execute(**kwargs)
+
+    assert [i.worktime for i in items] == [
+        worktime,
+        worktime - interval_timedelta * 4,
+        worktime - interval_timedelta * 5,
+    ]
+    assert items[0].retries == 1
+
+
+def test_claim_items(pendulum_utcnow):
+    FlowItem.delete().where(FlowItem.name == FLOW_NAME).execute()
+
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    period = dict(from_time=worktime - dt.timedelta(2), to_time=worktime)
+    FlowItem.create_items(
+        FLOW_NAME,
+        iter_range_datetime(
+            **{
+                "start_time": worktime - dt.timedelta(2),
+                "end_time": worktime,
+                "timedelta": dt.timedelta(1),
+            }
+        ),
+    )
+
+    assert (
+        FlowItem.claim_items(FLOW_NAME, owner="node1", lease_seconds=60, **period) == 3
+    )
+    # Items are executed by only one owner.
+    assert (
+        FlowItem.claim_items(FLOW_NAME, owner="node2", lease_seconds=60, **period) == 0
+    )
+
+    pendulum.set_test_now(pendulum_utcnow.add(seconds=50))
+    assert FlowItem.renew_leases("node1", lease_seconds=60) == 3
+
+    pendulum.set_test_now(pendulum_utcnow.add(seconds=100))
+    assert (
+        FlowItem.claim_items(FLOW_NAME, owner="node2", lease_seconds=60, **period) == 0
+    )
+
+    # The owner crashed and did not renew the lease.
+    pendulum.set_test_now(pendulum_utcnow.add(seconds=200))
+    assert (
+        FlowItem.claim_items(FLOW_NAME, owner="node2", lease_seconds=60, **period) == 3
+    )
+    assert FlowItem.renew_leases("node1") == 0
+
+
+def test_clear_statuses_of_lost_items(pendulum_utcnow):
+    FlowItem.delete().where(FlowItem.name == FLOW_NAME).execute()
+
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    FlowItem.create_items(FLOW_NAME, [worktime])
+    FlowItem.create_items(
+        FLOW_NAME, [worktime - dt.timedelta(1)], **{FlowItem.status.name: Statuses.run}
+    )
+    FlowItem.claim_items(
+        FLOW_NAME, owner="node1", lease_seconds=60, from_time=worktime, to_time=worktime
+    )
+
+    FlowItem.clear_statuses_of_lost_items()
+
+    # The item without a lease is returned, the leased one is left to its owner.
+    assert FlowItem.count_items(FLOW_NAME, statuses=[Statuses.add]) == 1
+    assert FlowItem.count_items(FLOW_NAME, statuses=[Statuses.run]) == 1
+
+
+def test_create_items_updates_existing():
+    FlowItem.delete().where(FlowItem.name == FLOW_NAME).execute()
+
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    worktime_list = [worktime - dt.timedelta(1), worktime]
+    FlowItem.create_items(FLOW_NAME, worktime_list[:1], logpath="first.log")
+
+    items = FlowItem.create_items(
+        FLOW_NAME, reversed(worktime_list), data={"step": "export"}
+    )
+
+    assert [i.worktime for i in items] == list(reversed(worktime_list))
+    assert [i.data for i in items] == [{"step": "export"}, {"step": "export"}]
+    assert [i.logpath for i in items] == [None, "first.log"]
+
+
+def test_bulk_update_items():
+    FlowItem.delete().where(FlowItem.name == FLOW_NAME).execute()
+
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    items = FlowItem.create_missing_items(
+        FLOW_NAME, worktime - dt.timedelta(4), worktime, dt.timedelta(1)
+    )
+
+    assert (
+        FlowItem.bulk_update_items(
+            items, **{FlowItem.status.name: Statuses.success, "data_errors": []}
+        )
+        == 5
+    )
+    assert all(i.status == Statuses.success for i in items)
+    assert FlowItem.count_items(FLOW_NAME, statuses=[Statuses.success]) == 5
+
+
+def test_migrate_to_epoch_storage():
+    from flowmaster.database import db
+    from flowmaster.models import migrate_to_epoch_storage, migration_database
+
+    FlowItem.delete().where(FlowItem.name == FLOW_NAME).execute()
+    # Row of the older version, the cursor waits for the background write.
+    db.execute_sql(
+        "INSERT INTO flowitem (name, worktime, status, data, notebook_hash, retries, "
+        "started_utc, created_utc, updated_utc) "
+        "VALUES (?, ?, 'add', '{}', '', 0, ?, ?, ?)",
+        (
+            FLOW_NAME,
+            "2020-01-06T00:00:00 Europe/Moscow",
+            "2021-01-01T10:10:10.123456",
+            "2021-01-01T10:10:10",
+            "2021-01-01T10:10:10",
+        ),
+    ).lastrowid
+
+    with migration_database() as database:
+        migrate_to_epoch_storage(database)
+
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    item = FlowItem.get(FlowItem.name == FLOW_NAME)
+    assert item.worktime_ts == worktime.int_timestamp
+    assert item.started_utc == pendulum.datetime(
+        2021, 1, 1, 10, 10, 10, 123456, tz="UTC"
+    )
+    assert FlowItem.count_items(FLOW_NAME) == 1
+    assert FlowItem.clear(FLOW_NAME, from_time=worktime, to_time=worktime) == 1
+
+
+def test_range_queries_use_index():
+    from flowmaster.database import db
+
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    query = FlowItem.select().where(
+        FlowItem.name == FLOW_NAME,
+        FlowItem.status == Statuses.add,
+        FlowItem.worktime_ts >= worktime,
+    )
+    sql, params = query.sql()
+    plan = db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+
+    assert "flowitem_name_status_worktime_ts" in str(plan)
+
+
+def test_archive_items(tmp_path, pendulum_utcnow):
+    import gzip
+
+    import orjson
+
+    from flowmaster.models import FlowItemArchive
+
+    FlowItem.clear(FLOW_NAME)
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    start_time = worktime - dt.timedelta(4)
+    FlowItem.create_missing_items(FLOW_NAME, start_time, worktime, dt.timedelta(1))
+    FlowItem.change_status(
+        FLOW_NAME, Statuses.success, to_time=worktime - dt.timedelta(1)
+    )
+    FlowItem.change_status(FLOW_NAME, Statuses.error, to_time=start_time)
+    path = tmp_path / "archive.jsonl.gz"
+
+    # The error item is left for retries.
+    assert FlowItem.archive_items(FLOW_NAME, worktime, path) == 3
+    assert FlowItem.archive_items(FLOW_NAME, worktime, path) == 0
+    with gzip.open(path) as file:
+        archived = [orjson.loads(line) for line in file]
+    assert [i["status"] for i in archived] == [Statuses.success] * 3
+    assert FlowItem.count_items(FLOW_NAME) == 2
+    assert FlowItemArchive.get(FlowItemArchive.name == FLOW_NAME).count == 3
+
+    # The archived items are not created again by keep_sequence.
+    FlowItem.get_items_for_execute(
+        FLOW_NAME,
+        worktime=worktime,
+        start_time=start_time,
+        interval_timedelta=dt.timedelta(1),
+        keep_sequence=True,
+        retries=0,
+        retry_delay=0,
+        notebook_hash="",
+        max_fatal_errors=1,
+    )
+    assert FlowItem.count_items(FLOW_NAME) == 2
+
+    FlowItem.clear(FLOW_NAME)
+    assert FlowItemArchive.get_or_none(FlowItemArchive.name == FLOW_NAME) is None
+
+
+def test_status_counters():
+    from flowmaster.models import FlowStatusCounter
+
+    def group_by_counts():
+        return {
+            (i.name, i.status): i.count
+            for i in FlowItem.count_items_by_name_and_status()
+            if i.name == FLOW_NAME
+        }
+
+    def counter_counts():
+        return {
+            key: count
+            for key, count in FlowStatusCounter.counts().items()
+            if key[0] == FLOW_NAME and count
+        }
+
+    FlowItem.clear(FLOW_NAME)
+    worktime = pendulum.datetime(2020, 1, 6, tz="Europe/Moscow")
+    items = FlowItem.create_missing_items(
+        FLOW_NAME, worktime - dt.timedelta(4), worktime, dt.timedelta(1)
+    )
+    assert counter_counts() == {(FLOW_NAME, Statuses.add): 5}
+
+    FlowItem.claim_items(
+        FLOW_NAME, from_time=worktime - dt.timedelta(1), to_time=worktime
+    )
+    FlowItem.bulk_update_items(items[:1], status=Statuses.success)
+    FlowItem.create_items(FLOW_NAME, [items[1].worktime], status=Statuses.error)
+    # The status does not change.
+    FlowItem.bulk_update_items(items[:1], status=Statuses.success)
+    FlowItem.clear(FLOW_NAME, from_time=worktime, to_time=worktime)
+
+    assert counter_counts() == group_by_counts()
+    assert counter_counts() == {
+        (FLOW_NAME, Statuses.add): 1,
+        (FLOW_NAME, Statuses.run): 1,
+        (FLOW_NAME, Statuses.success): 1,
+        (FLOW_NAME, Statuses.error): 1,
+    }
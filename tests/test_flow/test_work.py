@@ -102,3 +102,86 @@ def test_current_worktime_second_interval(
     work = Work(ya_metrika_logs_to_csv_notebook)
 
     assert work.current_worktime == pendulum.today(tz).replace(hour=1)
+
+
+def test_ordering_flow_tasks_through_broker(
+    tmp_path, flowitem_model, ya_metrika_logs_to_csv_notebook
+):
+    from flowmaster.broker import SqliteBroker
+    from flowmaster.enums import Statuses
+    from flowmaster.operators.base.work import ordering_flow_tasks
+
+    node1 = SqliteBroker(tmp_path / "broker.sqlite", node_id="node1")
+    node2 = SqliteBroker(tmp_path / "broker.sqlite", node_id="node2")
+
+    with mock.patch(
+        "flowmaster.service.iter_active_notebook_filenames"
+    ) as a, mock.patch("flowmaster.service.get_notebook") as b:
+        a.return_value = [ya_metrika_logs_to_csv_notebook.name]
+        b.return_value = (True, None, None, ya_metrika_logs_to_csv_notebook, None)
+
+        tasks1 = list(ordering_flow_tasks(broker=node1, batch_size=2))
+        # The second node does not order, it only takes the remaining tasks.
+        tasks2 = list(ordering_flow_tasks(broker=node2))
+
+    assert len(tasks1) == 2
+    assert len(tasks2) == 3
+    assert (
+        flowitem_model.count_items(
+            ya_metrika_logs_to_csv_notebook.name, statuses=[Statuses.run]
+        )
+        == 5
+    )
+
+
+def test_broker_tasks_are_leased_by_executing_node(
+    tmp_path, flowitem_model, ya_metrika_logs_to_csv_notebook
+):
+    from flowmaster.broker import SqliteBroker
+    from flowmaster.enums import Statuses
+    from flowmaster.models import FlowItem
+    from flowmaster.operators.base.work import ordering_flow_tasks
+    from flowmaster.setttings import Settings
+
+    name = ya_metrika_logs_to_csv_notebook.name
+    node1 = SqliteBroker(tmp_path / "broker.sqlite", node_id="node1")
+    node2 = SqliteBroker(tmp_path / "broker.sqlite", node_id="node2")
+
+    with mock.patch(
+        "flowmaster.service.iter_active_notebook_filenames"
+    ) as a, mock.patch("flowmaster.service.get_notebook") as b:
+        a.return_value = [name]
+        b.return_value = (True, None, None, ya_metrika_logs_to_csv_notebook, None)
+
+        # The first node orders all tasks, but executes only two of them.
+        assert len(list(ordering_flow_tasks(broker=node1, batch_size=2))) == 2
+        assert len(list(ordering_flow_tasks(broker=node2))) == 3
+
+    def owners():
+        items = FlowItem.select().where(FlowItem.name == name)
+        return sorted(i.lease_owner for i in items)
+
+    assert owners() == ["node1"] * 2 + ["node2"] * 3
+    # The ordering node renews only the leases of the items it executes.
+    assert FlowItem.renew_leases("node1") == 2
+
+    # The second node crashed, its items are reclaimed after its lease expires,
+    # while the first node keeps renewing its own.
+    now = pendulum.now("UTC")
+    pendulum.set_test_now(now.add(seconds=Settings.ITEM_LEASE_SECONDS - 1))
+    assert FlowItem.renew_leases("node1") == 2
+    pendulum.set_test_now(now.add(seconds=Settings.ITEM_LEASE_SECONDS + 1))
+    try:
+        assert (
+            FlowItem.claim_items(
+                name,
+                owner="node1",
+                from_time=pendulum.datetime(2000, 1, 1),
+                to_time=pendulum.datetime(2100, 1, 1),
+            )
+            == 3
+        )
+    finally:
+        pendulum.set_test_now()
+
+    assert flowitem_model.count_items(name, statuses=[Statuses.run]) == 5
@@ -31,3 +31,34 @@ def test_ordering_flow_tasks_with_interval_seconds(
             pendulum.set_test_now(pendulum_utcnow)
 
     assert len(all_tasks) == 4
+
+
+def test_ordering_skips_flows_that_are_not_due(
+    pendulum_utcnow, flowitem_model, flowmasterdata_items_to_csv_notebook
+):
+    from flowmaster.operators.base.work import flow_due_index, ordering_flow_tasks
+
+    with mock.patch(
+        "flowmaster.service.iter_active_notebook_filenames"
+    ) as a, mock.patch("flowmaster.service.get_notebook") as b, mock.patch.object(
+        flowitem_model,
+        "get_items_for_execute",
+        wraps=flowitem_model.get_items_for_execute,
+    ) as get_items_for_execute:
+        a.return_value = [flowmasterdata_items_to_csv_notebook.name]
+        b.return_value = (True, None, None, flowmasterdata_items_to_csv_notebook, None)
+
+        assert len(list(ordering_flow_tasks())) == 1
+        assert get_items_for_execute.call_count == 1
+
+        # The next worktime has not come, the database is not queried.
+        assert len(list(ordering_flow_tasks())) == 0
+        assert get_items_for_execute.call_count == 1
+
+        flow_due_index.mark_due(flowmasterdata_items_to_csv_notebook.name)
+        assert len(list(ordering_flow_tasks())) == 0
+        assert get_items_for_execute.call_count == 2
+
+        pendulum.set_test_now(pendulum_utcnow + dt.timedelta(seconds=60))
+        assert len(list(ordering_flow_tasks())) == 1
+        assert get_items_for_execute.call_count == 3
@@ -0,0 +1,338 @@
+import copy
+import datetime as dt
+import threading
+import time
+
+import pytest
+from clickhouse_driver.bufferedreader import BufferedSocketReader
+from clickhouse_driver.bufferedwriter import BufferedSocketWriter
+from clickhouse_driver.columns.service import read_column, write_column
+from clickhouse_driver.errors import ServerException
+
+from flowmaster.operators.etl.core import ETLOperator
+from flowmaster.operators.etl.dataschema import ExportContext
+from flowmaster.operators.etl.enums import DataOrient
+
+
+@pytest.fixture(autouse=True)
+def clear_validated_tables():
+    from flowmaster.operators.etl.loaders.clickhouse import service
+
+    service._validated_tables.clear()
+
+
+class FakeClickhouse:
+    """
+    Answers the queries of the loader instead of the server,
+    keeps the number of rows in the partitions of tables.
+    """
+
+    def __init__(self, insert_delay: float = 0, failed_insert: int = None):
+        self.queries = []
+        self.parts = {}
+        self.lose_rows = False
+        self.insert_kwargs = []
+        self.insert_delay = insert_delay
+        self.failed_insert = failed_insert
+        self.table_dropped = False
+        self.running_inserts = 0
+        self.max_running_inserts = 0
+        self.lock = threading.Lock()
+
+    @property
+    def rows(self) -> dict[str, int]:
+        return {table: sum(parts.values()) for table, parts in self.parts.items()}
+
+    def execute(self, query, params=None, **kwargs):
+        query = " ".join(query.split())
+        with self.lock:
+            self.queries.append(query)
+
+        if query.startswith("INSERT INTO") and params is not None:
+            return self.insert(query, params, **kwargs)
+
+        words = query.split()
+        if self.table_dropped and query.startswith("CREATE TABLE IF NOT EXISTS"):
+            self.table_dropped = False
+            if " as " in query:
+                raise ServerException("Table does not exist", code=60)
+        elif query.startswith("EXISTS TABLE"):
+            return [[0]]
+        elif query.startswith("DESCRIBE TABLE"):
+            return [("Date", "Date", "", ""), ("_inserted", "DateTime", "DEFAULT", "")]
+        elif query.startswith("SELECT count() FROM"):
+            return [[self.rows.get(words[3], 0)]]
+        elif query.startswith("SELECT DISTINCT partition_id FROM system.parts"):
+            table = f"{params['db']}.{params['table']}"
+            return [(partition_id,) for partition_id in self.parts.get(table, {})]
+        elif query.startswith("INSERT INTO"):
+            # INSERT SELECT from the staging table.
+            table, from_table = words[2], query.split(" FROM ")[1].split()[0]
+            for partition_id, rows in self.parts.get(from_table, {}).items():
+                self.add_rows(table, partition_id, rows)
+        elif query.startswith("TRUNCATE TABLE"):
+            self.parts[words[2]] = {}
+        elif query.startswith("ALTER TABLE") and " PARTITION ID " in query:
+            table, command, partition_id = words[2], words[3], words[6].strip("'")
+            if command == "DROP":
+                self.parts[table].pop(partition_id, None)
+            else:
+                rows = self.parts[words[8]][partition_id]
+                if command == "REPLACE":
+                    self.parts.setdefault(table, {})[partition_id] = 0
+                self.add_rows(table, partition_id, rows)
+        elif query.startswith("ALTER TABLE") and " DROP PARTITION " in query:
+            partition_id = words[-1].strip("()'").replace("-", "")
+            self.parts.get(words[2], {}).pop(partition_id, None)
+
+        return []
+
+    def add_rows(self, table: str, partition_id: str, rows: int) -> None:
+        parts = self.parts.setdefault(table, {})
+        parts[partition_id] = parts.get(partition_id, 0) + rows
+
+    def insert(self, query, params, **kwargs):
+        with self.lock:
+            self.insert_kwargs.append(kwargs)
+            number = len(self.insert_kwargs)
+            self.running_inserts += 1
+            self.max_running_inserts = max(
+                self.max_running_inserts, self.running_inserts
+            )
+        try:
+            time.sleep(self.insert_delay)
+            if number == self.failed_insert:
+                raise ConnectionError("Insert failed")
+
+            table = query.split()[2]
+            # The first column is Date, the partition key.
+            dates = params[0] if kwargs.get("columnar") else [r[0] for r in params]
+            with self.lock:
+                if not self.lose_rows:
+                    for date in dates:
+                        self.add_rows(table, date.strftime("%Y%m%d"), 1)
+            return len(dates)
+        finally:
+            with self.lock:
+                self.running_inserts -= 1
+
+    def client(self):
+        import clickhousepy
+
+        client = clickhousepy.Client(host="localhost")
+        client.execute = self.execute
+        return client
+
+    def patch(self, loader) -> None:
+        loader.client.execute = self.execute
+        loader.create_client = self.client
+
+
+def load(notebook, chunks: int, clickhouse: FakeClickhouse = None) -> FakeClickhouse:
+    flow = ETLOperator(notebook)
+    clickhouse = clickhouse or FakeClickhouse()
+    clickhouse.patch(flow.Load)
+    with flow.Load:
+        for i in range(chunks):
+            flow.Load(
+                flow.transform(
+                    ExportContext(
+                        columns=["date"],
+                        data=[[dt.date(2021, 1, i + 1)], [dt.date(2021, 1, i + 1)]],
+                        data_orient=DataOrient.values,
+                    )
+                )
+            )
+
+    return clickhouse
+
+
+def test_insert_does_not_count_rows(csv_to_clickhouse_notebook):
+    clickhouse = load(csv_to_clickhouse_notebook, chunks=3)
+
+    inserts = [
+        i for i, q in enumerate(clickhouse.queries) if q.endswith(" (Date) VALUES")
+    ]
+    counts = [i for i, q in enumerate(clickhouse.queries) if "count()" in q]
+    assert len(inserts) == 3
+    assert not [i for i in counts if i < inserts[-1]]
+    assert clickhouse.rows["default.__test_csv_to_clickhouse__"] == 6
+
+
+def test_insert_checks_rows_at_exit(csv_to_clickhouse_notebook):
+    flow = ETLOperator(csv_to_clickhouse_notebook)
+    clickhouse = FakeClickhouse()
+    clickhouse.patch(flow.Load)
+
+    with pytest.raises(AssertionError, match="staging table"):
+        with flow.Load:
+            clickhouse.lose_rows = True
+            flow.Load(
+                flow.transform(
+                    ExportContext(
+                        columns=["date"],
+                        data=[[dt.date(2021, 1, 1)]],
+                        data_orient=DataOrient.values,
+                    )
+                )
+            )
+
+    # The target table is not changed, the staging table is dropped.
+    assert not [q for q in clickhouse.queries if "DROP PARTITION" in q]
+    assert clickhouse.queries[-1].startswith("DROP TABLE IF EXISTS default.")
+
+
+def test_insert_mode(csv_to_clickhouse_notebook):
+    clickhouse = load(csv_to_clickhouse_notebook, chunks=1)
+    assert clickhouse.insert_kwargs == [{"types_check": True, "columnar": True}]
+
+    csv_to_clickhouse_notebook.load.insert_mode = "native"
+    clickhouse = load(csv_to_clickhouse_notebook, chunks=1)
+    assert clickhouse.insert_kwargs == [{"types_check": False, "columnar": True}]
+
+
+class BufferSocket:
+    def __init__(self):
+        self.data = bytearray()
+        self.position = 0
+
+    def sendall(self, data):
+        self.data += data
+
+    def recv_into(self, buffer, size=0):
+        chunk = self.data[self.position : self.position + (size or len(buffer))]
+        buffer[: len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+
+class ServerInfo:
+    def get_timezone(self):
+        return "UTC"
+
+
+def test_native_format_round_trip(csv_to_clickhouse_notebook):
+    """The transformed columns are written to Native without checking values."""
+    from flowmaster.operators.etl.dataschema import ColumnarBatch
+
+    columns = {
+        "date": "Date Date",
+        "datetime": "DateTime DateTime",
+        "name": "Name Nullable(String)",
+        "count": "Count UInt64",
+        "price": "Price Float64",
+        "tags": "Tags Array(String)",
+    }
+    columns_types = dict(column.split(" ") for column in columns.values())
+    notebook = csv_to_clickhouse_notebook
+    notebook.transform.column_map = {k: v.split(" ")[0] for k, v in columns.items()}
+    notebook.load.table_schema.columns = list(columns.values())
+    notebook.load.insert_mode = "native"
+    flow = ETLOperator(notebook)
+    transform_context = flow.transform(
+        ExportContext(
+            columns=list(columns),
+            data=[
+                ["2021-01-01", "2021-01-01 10:00:00", "", "10", "1.5", ["a", "b"]],
+                ["2021-01-02", "2021-01-02 23:59:59", "б", "0", "-2", []],
+            ],
+            data_orient=DataOrient.values,
+        )
+    )
+    batch = transform_context.data
+    assert isinstance(batch, ColumnarBatch)
+    # The driver converts the items in place when writing.
+    expected = copy.deepcopy(batch.data)
+
+    # Settings of the client of the loader, the server is not connected.
+    context = flow.Load.client.connection.context
+    context.server_info = ServerInfo()
+    socket = BufferSocket()
+    writer = BufferedSocketWriter(socket, 1024)
+    for name, items in zip(batch.columns, batch.data):
+        write_column(
+            context, name, columns_types[name], items, writer, types_check=False
+        )
+    writer.flush()
+
+    reader = BufferedSocketReader(socket, 1024)
+    data = [
+        list(read_column(context, columns_types[name], batch.num_rows, reader))
+        for name in batch.columns
+    ]
+    assert data == expected
+    assert data[0] == [dt.date(2021, 1, 1), dt.date(2021, 1, 2)]
+
+
+def test_parallel_inserts(csv_to_clickhouse_notebook):
+    csv_to_clickhouse_notebook.load.insert_parallelism = 3
+    clickhouse = load(
+        csv_to_clickhouse_notebook, chunks=9, clickhouse=FakeClickhouse(0.05)
+    )
+
+    assert clickhouse.max_running_inserts == 3
+    assert clickhouse.rows["default.__test_csv_to_clickhouse__"] == 18
+
+
+def test_parallel_inserts_raise_first_error(csv_to_clickhouse_notebook):
+    csv_to_clickhouse_notebook.load.insert_parallelism = 2
+    clickhouse = FakeClickhouse(0.05, failed_insert=2)
+
+    with pytest.raises(ConnectionError):
+        load(csv_to_clickhouse_notebook, chunks=2, clickhouse=clickhouse)
+
+    assert not [q for q in clickhouse.queries if "DROP PARTITION" in q]
+    assert clickhouse.queries[-1].startswith("DROP TABLE IF EXISTS default.")
+
+
+@pytest.mark.parametrize("data_cleaning_mode", ["partition", "off", "truncate"])
+def test_publish_mode(csv_to_clickhouse_notebook, data_cleaning_mode):
+    table = "default.__test_csv_to_clickhouse__"
+    csv_to_clickhouse_notebook.load.data_cleaning_mode = data_cleaning_mode
+    results = {}
+    for publish_mode in ("copy", "replace_partition"):
+        csv_to_clickhouse_notebook.load.publish_mode = publish_mode
+        clickhouse = FakeClickhouse()
+        clickhouse.parts[table] = {"20201231": 7, "20210101": 5}
+        load(csv_to_clickhouse_notebook, chunks=2, clickhouse=clickhouse)
+        results[publish_mode] = clickhouse.parts[table]
+
+        copies = [q for q in clickhouse.queries if "INSERT INTO" in q and "SELECT" in q]
+        assert len(copies) == (publish_mode == "copy")
+
+    assert results["copy"] == results["replace_partition"]
+    assert results["copy"] == {
+        "partition": {"20201231": 7, "20210101": 2, "20210102": 2},
+        "off": {"20201231": 7, "20210101": 7, "20210102": 2},
+        "truncate": {"20210101": 2, "20210102": 2},
+    }[data_cleaning_mode]
+
+
+def test_table_validation_is_cached(csv_to_clickhouse_notebook, monkeypatch):
+    from flowmaster.operators.etl.loaders.clickhouse.service import ClickhouseLoader
+
+    def setup_queries(clickhouse: FakeClickhouse) -> list[str]:
+        """The first words of the queries before the first insert."""
+        queries = []
+        for query in clickhouse.queries:
+            if query.endswith("VALUES"):
+                return queries
+            queries.append(query.split()[0])
+
+    clickhouse = load(csv_to_clickhouse_notebook, chunks=1)
+    assert "DESCRIBE" in setup_queries(clickhouse)
+
+    # Only the staging table is created.
+    clickhouse = load(csv_to_clickhouse_notebook, chunks=1)
+    assert setup_queries(clickhouse) == ["CREATE"]
+
+    # The table was dropped after the validation.
+    clickhouse = FakeClickhouse()
+    clickhouse.table_dropped = True
+    load(csv_to_clickhouse_notebook, chunks=1, clickhouse=clickhouse)
+    assert "DESCRIBE" in setup_queries(clickhouse)
+    assert clickhouse.rows["default.__test_csv_to_clickhouse__"] == 2
+
+    monkeypatch.setattr(ClickhouseLoader, "table_cache_ttl", 0)
+    clickhouse = load(csv_to_clickhouse_notebook, chunks=1)
+    assert "DESCRIBE" in setup_queries(clickhouse)
@@ -1,3 +1,5 @@
+import pydantic
+import pytest
 from freezegun import freeze_time
 
 from flowmaster.operators.etl.core import ETLOperator
@@ -21,3 +23,58 @@ def test_jinja_template(ya_metrika_logs_to_csv_notebook):
     assert flow.Load.file_name == "flow yandex_metrika_logs csv 2021-01-01.tsv"
     assert flow.Load.add_data_before == "flow yandex_metrika_logs csv 2021-01-01.tsv"
     assert flow.Load.add_data_after == "flow yandex_metrika_logs csv 2021-01-01.tsv"
+
+
+def test_columnar_batch(sqlite_to_csv_notebook):
+    from flowmaster.operators.etl.dataschema import ColumnarBatch, ExportContext
+    from flowmaster.operators.etl.enums import DataOrient
+
+    columns = ["id", "name"]
+    rows = [[1, "a"], [2, "b"], [3, "c"]]
+    batch = ColumnarBatch.from_values(columns, rows)
+    assert batch.data == [[1, 2, 3], ["a", "b", "c"]]
+    assert len(batch) == 3
+    assert batch.to_values() == [(1, "a"), (2, "b"), (3, "c")]
+
+    sqlite_to_csv_notebook.load.with_columns = False
+    flow = ETLOperator(sqlite_to_csv_notebook)
+    context = flow.transform(
+        ExportContext(columns=columns, data=batch, data_orient=DataOrient.columns)
+    )
+    values_context = flow.transform(
+        ExportContext(columns=columns, data=rows, data_orient=DataOrient.values)
+    )
+    assert isinstance(context.data, ColumnarBatch)
+    assert context.data == values_context.data
+    assert len(context.data) == 3
+
+    with flow.Load:
+        flow.Load(context)
+
+    assert flow.Load.file_path.read_text().splitlines() == [
+        '1\t"a"',
+        '2\t"b"',
+        '3\t"c"',
+    ]
+
+
+def test_contexts_pass_payload_as_is(sqlite_to_csv_notebook):
+    from flowmaster.operators.etl.dataschema import ExportContext
+    from flowmaster.operators.etl.enums import DataOrient
+
+    # Rows of a database cursor.
+    rows = ((1, "a"), (2, "b"))
+    export_context = ExportContext(
+        columns=["id", "name"], data=rows, data_orient=DataOrient.values
+    )
+    assert export_context.data is rows
+
+    flow = ETLOperator(sqlite_to_csv_notebook)
+    transform_context = flow.transform(export_context)
+    assert transform_context.data.to_values() == [(1, "a"), (2, "b")]
+
+    # The metadata is still validated.
+    with pytest.raises(pydantic.ValidationError):
+        ExportContext(columns=["id"], data=rows, data_orient="rows")
+    with pytest.raises(pydantic.ValidationError):
+        ExportContext(columns=["id"], data_orient=DataOrient.values)
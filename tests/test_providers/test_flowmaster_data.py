@@ -45,3 +45,28 @@ def test_flow_flowmasterdata_pools(
         if "____test_flowmasterdata_items_to_csv___load_concurrency__" in row
     ]
     assert [row for row in data if "name\tsize\tlimit\tdatetime" in row]
+
+
+def test_flow_flowmasterdata_queues(
+    flowmasterdata_items_to_csv_notebook, flowmasterdata_queues_export_policy
+):
+    from flowmaster.executors import ThreadAsyncExecutor
+
+    def flow():
+        yield
+
+    flowmasterdata_items_to_csv_notebook.export = flowmasterdata_queues_export_policy
+    # Without workers, the ordered tasks remain in the queue of the executor.
+    executor = ThreadAsyncExecutor(ordering_task_func=lambda: [flow(), flow()])
+    executor.start(workers=0, orders=1, interval=0.1)
+    executor.threads["Flowmaster_scheduler"].join()
+
+    etl_flow = ETLOperator(flowmasterdata_items_to_csv_notebook)
+    etl_flow.dry_run(dt.datetime(2021, 2, 1), dt.datetime(2021, 2, 1))
+    executor.stop()
+
+    with etl_flow.Load.open_file(mode="r") as loadfile:
+        data = loadfile.readlines()
+
+    assert [row for row in data if row.startswith('"tasks"\t2\t')]
+    assert executor.queue_sizes() == {"tasks": 0, "sleeptasks": 0}
@@ -0,0 +1,53 @@
+import time
+
+from flowmaster.executors import (
+    AsyncioExecutor,
+    ExecutorIterationTask,
+    NextIterationInPools,
+    SleepIteration,
+)
+from flowmaster.pool import pools
+
+
+def test_sleep_tasks_do_not_occupy_workers():
+    completed_tasks = []
+    count_task = 4
+
+    def flow():
+        yield SleepIteration(sleep=1)
+        completed_tasks.append(1)
+
+    def ordering_task(*args, **kwargs):
+        for _ in range(count_task):
+            yield ExecutorIterationTask(flow())
+
+    executor = AsyncioExecutor(ordering_task_func=ordering_task)
+    executor.start(workers=1, orders=1)
+    time.sleep(2)
+    executor.stop()
+
+    assert len(completed_tasks) == count_task
+
+
+def test_wake_task_on_pool_release():
+    completed_tasks = []
+    count_task = 3
+    pools.append_pools({"test_asyncio_wake_task_on_pool_release": 1})
+
+    def flow():
+        yield NextIterationInPools(
+            pool_names=["test_asyncio_wake_task_on_pool_release"], sleep=60
+        )
+        time.sleep(0.1)
+        completed_tasks.append(1)
+
+    def ordering_task(*args, **kwargs):
+        for _ in range(count_task):
+            yield ExecutorIterationTask(flow())
+
+    executor = AsyncioExecutor(ordering_task_func=ordering_task)
+    executor.start(workers=count_task, orders=1)
+    time.sleep(1)
+    executor.stop()
+
+    assert len(completed_tasks) == count_task
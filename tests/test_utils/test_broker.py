@@ -0,0 +1,100 @@
+import time
+
+from flowmaster.broker import SqliteBroker, get_broker
+from flowmaster.pool import Pool
+
+
+def test_broker_queue(tmp_path):
+    path = tmp_path / "broker.sqlite"
+    node1 = SqliteBroker(path, node_id="node1")
+    node2 = SqliteBroker(path, node_id="node2")
+
+    node1.push("tasks", [{"name": "flow", "number": i} for i in range(5)])
+
+    assert node2.qsize("tasks") == 5
+    assert [i["number"] for i in node2.pop("tasks", 2)] == [0, 1]
+    assert [i["number"] for i in node1.pop("tasks")] == [2, 3, 4]
+    assert node2.pop("tasks") == []
+
+
+def test_broker_lease(tmp_path):
+    path = tmp_path / "broker.sqlite"
+    node1 = SqliteBroker(path, node_id="node1")
+    node2 = SqliteBroker(path, node_id="node2")
+
+    assert node1.lease("ordering", ttl=0.2)
+    assert node1.lease("ordering", ttl=0.2)
+    assert not node2.lease("ordering")
+
+    time.sleep(0.3)
+    assert node2.lease("ordering")
+    assert not node1.lease("ordering")
+
+    node2.release_lease("ordering")
+    assert node1.lease("ordering")
+
+
+def test_broker_slots_of_dead_node(tmp_path):
+    path = tmp_path / "broker.sqlite"
+    node1 = SqliteBroker(path, node_id="node1")
+    node2 = SqliteBroker(path, node_id="node2")
+
+    assert node1.acquire_slots({"one": 1, "two": 2})
+    assert not node2.acquire_slots({"one": 1, "two": 2})
+    assert node2.slots("two") == 1
+
+    node2.node_ttl = 0
+    time.sleep(0.01)
+    # The slots of the node without a heartbeat are not taken into account.
+    assert node2.acquire_slots({"one": 1, "two": 2})
+
+
+def test_pool_with_broker(tmp_path):
+    broker_url = f"sqlite:///{tmp_path / 'broker.sqlite'}"
+    pools1 = Pool({"one": 1}, broker=get_broker(broker_url))
+    pools2 = Pool({"one": 1}, broker=get_broker(broker_url))
+    pools2.broker.node_id = "node2"
+    woken = []
+
+    class Waiter:
+        def wake(self):
+            woken.append(self)
+
+    waiter = Waiter()
+
+    assert pools1.acquire(["one"], Waiter())
+    assert pools2["one"] == 1
+    assert not pools2.acquire(["one"], waiter)
+
+    pools1[["one"]] = -1
+    assert woken == []
+
+    # Releasing by another node is detected on refresh.
+    pools2.refresh()
+    assert woken == [waiter]
+    assert pools2.acquire(["one"], waiter)
+    assert not pools1.allow(["one"])
+
+
+def test_broker_reads_do_not_take_write_lock(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "broker.sqlite"
+    node1 = SqliteBroker(path, node_id="node1")
+    node2 = SqliteBroker(path, node_id="node2")
+    assert node1.acquire_slots({"one": 2, "two": 2})
+    node1.push("tasks", [{"name": "flow"}])
+
+    writer = sqlite3.connect(str(path), timeout=0, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        # Reads of the slots and the queue are not serialized on the write lock.
+        assert node2.slots_of(["one", "two", "three"]) == {
+            "one": 1,
+            "two": 1,
+            "three": 0,
+        }
+        assert node2.qsize("tasks") == 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
@@ -65,3 +65,35 @@ def test_pool_uniq_name():
 
     assert set(pools.limits.keys()) == {"one", "one_", "two", "two_"}
     assert set(pools.sizes.keys()) == {"one", "one_", "two", "two_"}
+
+
+def test_pool_wait_list():
+    pools = Pool({"one": 1})
+    woken = []
+
+    class Waiter:
+        def __init__(self, name):
+            self.name = name
+
+        def wake(self):
+            woken.append(self.name)
+
+    first, second, third = Waiter("first"), Waiter("second"), Waiter("third")
+
+    assert pools.acquire(["one"], first)
+    assert not pools.acquire(["one"], second)
+    assert not pools.acquire(["one"], third)
+
+    pools[["one"]] = -1
+
+    # The slot is handed over to the first waiting, not to the newcomer.
+    assert woken == ["second"]
+    assert not pools.allow(["one"])
+    assert not pools.acquire(["one"], third)
+    assert pools.acquire(["one"], second)
+
+    pools[["one"]] = -1
+
+    assert woken == ["second", "third"]
+    assert pools.acquire(["one"], third)
+    assert not pools.waiters["one"]
@@ -54,6 +54,10 @@ def test_exeption_iteration_in_pool(pools):
             assert sleep_task.sleep == 1
             raise
 
+    # The abandoned task leaves the wait list of the pool.
+    task.cancel()
+    assert not pools.waiters["testpool"]
+
 
 def test_exeption_iteration_in_pool2(pools):
     pools.append_pools({"testpool": 0})
@@ -66,3 +70,39 @@ def test_exeption_iteration_in_pool2(pools):
     pools.update_pools({"testpool": 1})
 
     assert list(task) == ["item2"]
+
+
+def test_pool_released_before_next_pool(pools):
+    pools.append_pools({"step1": 1, "step2": 1})
+
+    def flow():
+        for _ in range(2):
+            yield NextIterationInPools(pool_names=["step1"])
+            yield NextIterationInPools(pool_names=["step2"])
+        yield "item"
+
+    task = ExecutorIterationTask(flow())
+
+    assert list(task) == ["item"]
+    assert pools["step1"] == 0
+    assert pools["step2"] == 0
+
+
+def test_wake_task_on_pool_release(pools):
+    pools.append_pools({"wakepool": 1})
+    woken = []
+    pools[["wakepool"]] = 1
+
+    generator = iter([NextIterationInPools(pool_names=["wakepool"]), "item"])
+    task = ExecutorIterationTask(generator)
+
+    with pytest.raises(PoolOverflowingException):
+        list(task)
+
+    task.on_pool_release(lambda: woken.append(task))
+    assert woken == []
+
+    pools[["wakepool"]] = -1
+
+    assert woken == [task]
+    assert list(task) == ["item"]
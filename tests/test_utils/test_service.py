@@ -0,0 +1,53 @@
+from unittest import mock
+
+
+def test_notebook_registry():
+    import flowmaster.service as service
+    from flowmaster.setttings import Settings
+
+    name = "__test_notebook_registry__.etl.yml"
+    path = Settings.NOTEBOOKS_DIR / name
+    path.write_text("provider: fakedata\n")
+    registry = service.NotebookRegistry()
+
+    try:
+        with mock.patch(
+            "flowmaster.service.get_notebook", wraps=service.get_notebook
+        ) as get_notebook:
+            result = registry.get(name)
+            assert registry.get(name) is result
+            assert get_notebook.call_count == 1
+
+            # The file is parsed again only after it has been changed.
+            path.write_text("provider: fakedata\nstorage: csv\n")
+            assert registry.get(name) is not result
+            assert get_notebook.call_count == 2
+
+            assert dict(registry.iter_active_notebooks())[name] is registry.get(name)
+            assert get_notebook.call_count == 2
+    finally:
+        path.unlink()
+
+
+def test_compact_items(pendulum_utcnow):
+    import pendulum
+
+    import flowmaster.service as service
+    from flowmaster.enums import Statuses
+    from flowmaster.models import FlowItem
+    from flowmaster.setttings import Settings
+
+    name = "__test_compact_items__"
+    FlowItem.clear(name)
+    worktime = pendulum.datetime(2020, 1, 1, tz="UTC")
+    FlowItem.create_items(
+        name, [worktime, pendulum_utcnow], **{FlowItem.status.name: Statuses.success}
+    )
+    path = Settings.ITEMS_ARCHIVE_DIR / f"{name}.jsonl.gz"
+    path.unlink(missing_ok=True)
+
+    # Without a retention period the items are kept.
+    assert name not in service.compact_items()
+    assert service.compact_items(default_retention_days=30)[name] == 1
+    assert [i.worktime for i in FlowItem.iter_items(name)] == [pendulum_utcnow]
+    assert path.exists()
@@ -11,6 +11,8 @@ from flowmaster.executors import (
     ExecutorIterationTask,
     ThreadAsyncExecutor,
     NextIterationInPools,
+    SleepException,
+    PoolOverflowingException,
 )
 from flowmaster.flow import Flow
 from flowmaster.operators.etl.core import ETLOperator
@@ -57,6 +59,51 @@ def test_sleep():
     assert s.allow() == True
 
 
+def test_wake_sleep_tasks_by_deadline():
+    def flow(sleep):
+        yield SleepIteration(sleep=sleep)
+
+    executor = ThreadAsyncExecutor(ordering_task_func=lambda: [], dry_run=True)
+    ready_queue = executor.ready_queue
+    tasks = {}
+    for sleep in (60, 0.1, 30):
+        task = ExecutorIterationTask(flow(sleep))
+        try:
+            list(task)
+        except SleepException:
+            executor.add_sleeping_task(task)
+        tasks[sleep] = task
+
+    time.sleep(0.2)
+    executor.wake_sleep_func()
+
+    assert ready_queue.get_nowait() is tasks[0.1]
+    assert ready_queue.qsize() == 0
+    assert [i[2] for i in sorted(executor.sleeping_task_storage)] == [
+        tasks[30],
+        tasks[60],
+    ]
+
+
+def test_ready_queue_priority():
+    import threading
+
+    from flowmaster.executors import ReadyQueue
+
+    queue = ReadyQueue()
+    stop_event = threading.Event()
+    queue.put("new")
+    queue.put("resumed", resumed=True)
+
+    assert queue.get(stop_event) == "resumed"
+    assert queue.get(stop_event) == "new"
+    assert queue.get(stop_event, timeout=0) is None
+
+    threading.Timer(0.1, stop_event.set).start()
+    threading.Timer(0.2, queue.wakeup).start()
+    assert queue.get(stop_event) is None
+
+
 def test_sanity_executor_flow():
     completed_tasks = []
     count_task = 4
@@ -100,7 +147,8 @@ def test_pool_sleep_iterations():
             yield ExecutorIterationTask(flow())
 
     executor = ThreadAsyncExecutor(ordering_task_func=ordering_task, dry_run=False)
-    executor.start(workers=workers, orders=orders)
+    # The scheduler waits for the whole interval between the orders.
+    executor.start(workers=workers, orders=orders, interval=1)
     time.sleep(sleep * iters * orders * count_task + 10)
     executor.stop()
 
@@ -313,3 +361,69 @@ def test_sanity_iterator_sleep_task(fakedata_to_csv_notebook):
     executor.start(workers=workers, interval=1)
     time.sleep(wait)
     executor.stop()
+
+
+def test_pool_release_between_acquire_and_wait(monkeypatch):
+    pools.append_pools({"test_pool_release_between_acquire_and_wait": 1})
+    pool_names = ["test_pool_release_between_acquire_and_wait"]
+    pool_acquire = pools.acquire
+
+    def acquire_and_release(tags, waiter):
+        is_acquired = pool_acquire(tags, waiter)
+        if not is_acquired:
+            # Another worker releases the slot before the task waits for it.
+            pools[tags] = -1
+        return is_acquired
+
+    pools[pool_names] = 1
+    monkeypatch.setattr(pools, "acquire", acquire_and_release)
+
+    def flow():
+        yield NextIterationInPools(pool_names=pool_names)
+        yield
+
+    task = ExecutorIterationTask(flow())
+    try:
+        next(task)
+    except PoolOverflowingException:
+        woken = []
+        task.on_pool_release(lambda: woken.append(1))
+        assert woken == [1]
+    else:
+        assert False, "The pool was full"
+
+    monkeypatch.undo()
+    assert next(task) is None
+    assert pools[pool_names[0]] == 0
+
+
+def test_parked_tasks_survive_garbage_collection():
+    import gc
+
+    pools.append_pools({"test_parked_tasks_survive_garbage_collection": 1})
+    pool_names = [list(pools.limits)[-1]]
+    completed_tasks = []
+
+    def flow(number):
+        yield NextIterationInPools(pool_names=pool_names)
+        time.sleep(0.1)
+        yield
+        completed_tasks.append(number)
+
+    def ordering_task(*args, **kwargs):
+        for number in range(6):
+            yield ExecutorIterationTask(flow(number))
+
+    executor = ThreadAsyncExecutor(ordering_task_func=ordering_task, dry_run=True)
+    executor.start(workers=2, orders=1)
+    time.sleep(0.05)
+    # The tasks waiting for a slot are referenced only by the pool and the executor.
+    gc.collect()
+    for _ in range(50):
+        if len(completed_tasks) == 6:
+            break
+        time.sleep(0.1)
+    executor.stop()
+
+    assert sorted(completed_tasks) == list(range(6))
+    assert not pools.waiters[pool_names[0]]
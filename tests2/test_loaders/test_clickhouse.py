@@ -83,3 +83,38 @@ def test_real_load_clickhouse(csv_to_clickhouse_notebook):
 
     finally:
         flow.Load.Table.drop_table()
+
+
+def test_real_load_clickhouse_replace_partition(csv_to_clickhouse_notebook):
+    def export_func(start_period, end_period) -> Iterator[tuple[dict, list, list]]:
+        yield ExportContext(
+            columns=["date"],
+            data=[[start_period], [end_period]],
+            data_orient=DataOrient.values,
+        )
+
+    Flow.ETLOperator.Providers.CSVProvider.export_class.__call__ = Mock(
+        side_effect=export_func
+    )
+
+    csv_to_clickhouse_notebook.load.publish_mode = (
+        ClickhouseLoader.PublishMode.replace_partition
+    )
+    csv_to_clickhouse_notebook.load.data_cleaning_mode = (
+        ClickhouseLoader.DataCleaningMode.partition
+    )
+    flow = Flow(csv_to_clickhouse_notebook)
+    flow.Load.Table.drop_table()
+    try:
+        for end_period in (dt.datetime(2021, 1, 2), dt.datetime(2021, 1, 3)):
+            flow = Flow(csv_to_clickhouse_notebook)
+            list(flow(start_period=dt.datetime(2021, 1, 2), end_period=end_period))
+
+        # The partition of 2021-01-02 with two rows is replaced by one row.
+        assert flow.Load.Table.select(columns=["Date"], order_by="Date") == [
+            (dt.date(2021, 1, 2),),
+            (dt.date(2021, 1, 3),),
+        ]
+
+    finally:
+        flow.Load.Table.drop_table()